@@ -1,8 +1,41 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import List, Optional
+import asyncio
+import json
+import os
+import time
+from contextlib import aclosing, nullcontext
 
-app = FastAPI(title="Bajaj Health Bill Processor", version="1.0.0")
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError, root_validator
+from pydantic.error_wrappers import ErrorWrapper
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile
+from typing import Dict, List, Optional, Tuple, Union
+
+import orjson
+
+from utils.admission import AdmissionController, OverloadedError
+from utils.deadline import DeadlineExceeded
+from utils.document_source import InlineDocument, InvalidDocumentError
+from utils.metrics import IN_FLIGHT, REQUEST_SECONDS, REQUESTS, latest
+from utils.pipeline import BillPipeline
+
+app = FastAPI(title="Bajaj Health Bill Processor", version="1.0.0", default_response_class=ORJSONResponse)
+pipeline = BillPipeline()
+admission = AdmissionController()
+
+# Documents of one batch request processed at the same time
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+# "on" warms the OCR stack and worker pools at startup; /health/ready stays 503 until it is done
+WARM_UP = os.environ.get("WARM_UP", "on")
+# Seconds a document may take from arrival, queueing included, before it is abandoned
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", 120))
+# How often a non-streaming request checks that its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+# Startup warm-up progress reported by /health/ready
+readiness = {"status": "warming_up", "error": None, "warm_up_seconds": None, "ocr_workers": None}
 
 class BillItem(BaseModel):
     item_name: str
@@ -13,12 +46,18 @@ class BillItem(BaseModel):
 class PageData(BaseModel):
     page_no: str
     page_type: str
+    # "embedded" (PDF text layer), "ocr", "cache" or "skipped" (triaged out as not a bill)
+    text_source: Optional[str] = None
     bill_items: List[BillItem]
 
 class ResponseData(BaseModel):
     pagewise_line_items: List[PageData]
     total_item_count: int
     reconciled_amount: float
+    # Pages triage found are not bills and never fully OCR'd
+    skipped_pages: List[str] = []
+    # Net OCR seconds triage saved on this request (negative when it cost more)
+    triage_seconds_saved: Optional[float] = None
 
 class TokenUsage(BaseModel):
     total_tokens: int = 0
@@ -28,69 +67,328 @@ class TokenUsage(BaseModel):
 class BillResponse(BaseModel):
     is_success: bool
     token_usage: TokenUsage
+    # Seconds per pipeline stage plus "total"; only present when requested
+    timings: Optional[Dict[str, float]] = None
+    # Why the document failed: rejected at capacity, deadline exceeded or a processing error
+    error: Optional[str] = None
     data: Optional[ResponseData] = None
 
 class BillRequest(BaseModel):
-    document: str
+    # URL or local path of the document...
+    document: Optional[str] = None
+    # ...or the document itself, base64 encoded (data: URLs accepted)
+    content: Optional[str] = None
+    filename: Optional[str] = None
+    include_timings: bool = False
+
+    @root_validator(skip_on_failure=True)
+    def exactly_one_source(cls, values):
+        if (values.get("document") is None) == (values.get("content") is None):
+            raise ValueError("Send exactly one of document or content")
+        return values
+
+    def source(self) -> Union[str, InlineDocument]:
+        """What the pipeline loads: the path or URL, or the inline content"""
+        if self.content is not None:
+            return InlineDocument(name=self.filename, base64_content=self.content)
+        return self.document
+
+class BatchRequest(BaseModel):
+    documents: List[BillRequest]
+
+class BatchResponse(BaseModel):
+    results: List[BillResponse]
+
+async def warm_up():
+    """Prime the pipeline in the background so the server answers liveness probes meanwhile"""
+    start = time.perf_counter()
+    try:
+        readiness["ocr_workers"] = await pipeline.warm_up()
+        readiness["status"] = "ready"
+    except Exception as e:
+        print(f"Failed to warm up: {str(e)}")
+        readiness.update(status="failed", error=str(e))
+    readiness["warm_up_seconds"] = round(time.perf_counter() - start, 3)
+
+@app.on_event("startup")
+async def start_warm_up():
+    if WARM_UP == "off":
+        readiness["status"] = "ready"
+        return
+    app.state.warm_up = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_pipeline():
+    task = getattr(app.state, "warm_up", None)
+    if task is not None and not task.done():
+        task.cancel()
+    await pipeline.close()
 
 @app.get("/")
 async def root():
     return {"message": "Bajaj Health Bill Processor API - First Submission", "status": "healthy"}
 
-@app.post("/extract-bill-data")
-async def extract_bill_data(request: BillRequest):
+@app.get("/health/live")
+async def liveness():
+    """The process is up and serving; never depends on OCR"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_probe():
+    """200 once the startup warm-up has finished, 503 while it runs or if it failed"""
+    return ORJSONResponse(readiness, status_code=200 if readiness["status"] == "ready" else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage and request latency histograms, counters and gauges"""
+    body, content_type = latest()
+    return Response(content=body, media_type=content_type)
+
+def format_timings(timings: Dict[str, float], start: float) -> Dict[str, float]:
+    """Round stage timings for the response and add the wall clock total"""
+    formatted = {name: round(seconds, 4) for name, seconds in timings.items()}
+    formatted["total"] = round(time.perf_counter() - start, 4)
+    return formatted
+
+async def read_bill_request(http_request: Request):
+    """(document, include_timings, form) from a JSON BillRequest or a multipart upload.
+
+    Multipart uploads stay in Starlette's spooled file and are memory mapped
+    once they are on disk; close the returned form when done with it.
+    """
+    if http_request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await http_request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            await form.close()
+            raise HTTPException(status_code=422, detail="Multipart requests need a 'file' field")
+        include_timings = form.get("include_timings", "").lower() in ("1", "true", "yes")
+        return InlineDocument(name=upload.filename, file=upload.file), include_timings, form
+    
+    try:
+        bill = BillRequest.parse_obj(await http_request.json())
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([ErrorWrapper(e, ("body", e.pos))])
+    except ValidationError as e:
+        raise RequestValidationError(e.raw_errors)
+    return bill.source(), bill.include_timings, None
+
+# Both request bodies /extract-bill-data and /extract-bill-data/stream accept
+BILL_REQUEST_BODIES = {"requestBody": {"content": {
+    "application/json": {"schema": {"$ref": "#/components/schemas/BillRequest"}},
+    "multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"],
+        "properties": {"file": {"type": "string", "format": "binary"}, "include_timings": {"type": "boolean"}}
+    }},
+}, "required": True}}
+
+def failed_response(error: str) -> dict:
+    """BillResponse for a document that produced no data"""
+    return {"is_success": False, "token_usage": TokenUsage().dict(), "error": error, "data": None}
+
+def overloaded_response(e: OverloadedError) -> ORJSONResponse:
+    return ORJSONResponse(failed_response(str(e)), status_code=429,
+                          headers={"Retry-After": str(e.retry_after)})
+
+async def process_bill(document: Union[str, InlineDocument], include_timings: bool = False,
+                       endpoint: str = "extract", deadline: float = None,
+                       queue_unbounded: bool = False) -> Tuple[int, dict]:
+    """Admit one document, run it through the pipeline and build its BillResponse.
+
+    Returns the HTTP status with the response: 400 when inline content
+    does not decode, 504 when the deadline (time.time(),
+    REQUEST_DEADLINE_SECONDS from now by default) passed.
+    Raises OverloadedError if admission turned the document away, which
+    never happens with `queue_unbounded`.
+    """
+    start = time.perf_counter()
+    deadline = deadline or time.time() + REQUEST_DEADLINE_SECONDS
+    timings = {}
+    status, outcome = 200, "success"
+    with IN_FLIGHT.track_inprogress():
+        try:
+            # A request joining an identical document already in flight adds no work, so takes no slot
+            slot = nullcontext() if pipeline.in_flight(document) else admission.admit(deadline, queue_unbounded)
+            async with slot:
+                pages = await pipeline.process(document, timings, deadline)
+            
+            response = {
+                "is_success": True,
+                "token_usage": {
+                    "total_tokens": 0,
+                    "input_tokens": 0, 
+                    "output_tokens": 0
+                },
+                "data": pipeline.build_response_data(pages, timings)
+            }
+            
+        except OverloadedError:
+            REQUESTS.labels(endpoint, "rejected").inc()
+            raise
+        except asyncio.CancelledError:
+            # Client went away; the pipeline has already stopped its pool work
+            REQUESTS.labels(endpoint, "cancelled").inc()
+            raise
+        except InvalidDocumentError as e:
+            print(f"Invalid document {document}: {str(e)}")
+            status, outcome = 400, "invalid"
+            response = failed_response(str(e))
+        except DeadlineExceeded:
+            print(f"Deadline exceeded processing {document}")
+            status, outcome = 504, "timeout"
+            response = failed_response("Processing did not finish before the request deadline")
+        except Exception as e:
+            print(f"Error processing {document}: {str(e)}")
+            outcome = "failure"
+            response = failed_response(str(e))
+    
+    REQUESTS.labels(endpoint, outcome).inc()
+    REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+    if include_timings:
+        response["timings"] = format_timings(timings, start)
+    return status, response
+
+async def unless_disconnected(http_request: Request, awaitable):
+    """Await `awaitable`, cancelling it if the client disconnects first; None then"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if not task.done() and await http_request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                return None
+        return task.result()
+    finally:
+        # Our own cancellation (server shutdown) must not leave the work running
+        task.cancel()
+
+@app.post("/extract-bill-data", response_model=BillResponse, openapi_extra=BILL_REQUEST_BODIES)
+async def extract_bill_data(http_request: Request):
     """
-    Simple version that returns correct format for first submission
+    Download, OCR and parse the bill without blocking the event loop.
+    Takes a JSON BillRequest (a URL/path or base64 content) or a multipart
+    upload in the "file" field. Set include_timings to get the per-stage
+    breakdown in the response
     """
+    document, include_timings, form = await read_bill_request(http_request)
     try:
-        # Sample data matching the exact format from problem statement
-        sample_items = [
-            {
-                "item_name": "Livi 300mg Tab",
-                "item_amount": 448.0,
-                "item_rate": 32.0,
-                "item_quantity": 14
-            },
-            {
-                "item_name": "Metnuro", 
-                "item_amount": 124.03,
-                "item_rate": 17.72,
-                "item_quantity": 7
+        result = await unless_disconnected(http_request, process_bill(document, include_timings))
+        if result is None:
+            # Nobody is listening; 499 is only for the access log
+            return Response(status_code=499)
+        status, response = result
+        # The payload already has the BillResponse shape, so it goes straight to
+        # orjson instead of being re-validated and re-encoded by the model
+        return ORJSONResponse(response, status_code=status)
+    except OverloadedError as e:
+        return overloaded_response(e)
+    finally:
+        if form is not None:
+            await form.close()
+
+@app.post("/extract-bill-data/batch", response_model=BatchResponse)
+async def extract_bill_data_batch(request: BatchRequest, http_request: Request):
+    """
+    Process many bills with at most BATCH_CONCURRENCY in flight; results
+    keep the order of the submitted documents and failures stay per document.
+    Each document's deadline starts when it is picked up. Documents wait
+    for a processing slot however full the queue is, so a large batch is
+    never rejected by its own backlog
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def process_with_limit(bill: BillRequest):
+        async with semaphore:
+            _, response = await process_bill(
+                bill.source(), bill.include_timings, endpoint="batch", queue_unbounded=True
+            )
+            return response
+    
+    results = await unless_disconnected(
+        http_request, asyncio.gather(*(process_with_limit(bill) for bill in request.documents))
+    )
+    if results is None:
+        return Response(status_code=499)
+    return ORJSONResponse({"results": results})
+
+async def stream_bill_records(document: Union[str, InlineDocument], include_timings: bool = False,
+                              deadline: float = None):
+    """Page records as each page is parsed, then one summary record"""
+    start = time.perf_counter()
+    deadline = deadline or time.time() + REQUEST_DEADLINE_SECONDS
+    timings = {}
+    outcome = "success"
+    total_item_count = 0
+    reconciled_amount = 0.0
+    # Enough of each page for the triage report, without holding every item
+    page_sources = []
+    with IN_FLIGHT.track_inprogress():
+        try:
+            async with admission.admit(deadline), aclosing(pipeline.iter_pages(document, timings, deadline)) as pages:
+                async for page in pages:
+                    total_item_count += len(page["bill_items"])
+                    reconciled_amount += sum(item.item_amount for item in page["bill_items"])
+                    page_sources.append({"page_no": page["page_no"], "text_source": page.get("text_source")})
+                    yield "page", page
+            summary = {
+                "is_success": True,
+                "token_usage": TokenUsage().dict(),
+                "data": {
+                    "total_item_count": total_item_count,
+                    "reconciled_amount": round(reconciled_amount, 2),
+                    **pipeline.triage_report(page_sources, timings)
+                }
             }
-        ]
-        
-        page_data = {
-            "page_no": "1",
-            "page_type": "Pharmacy", 
-            "bill_items": sample_items
-        }
-        
-        response_data = {
-            "pagewise_line_items": [page_data],
-            "total_item_count": len(sample_items),
-            "reconciled_amount": sum(item["item_amount"] for item in sample_items)
-        }
-        
-        return {
-            "is_success": True,
-            "token_usage": {
-                "total_tokens": 0,
-                "input_tokens": 0, 
-                "output_tokens": 0
-            },
-            "data": response_data
-        }
-        
-    except Exception as e:
-        return {
-            "is_success": False,
-            "token_usage": {
-                "total_tokens": 0,
-                "input_tokens": 0,
-                "output_tokens": 0
-            },
-            "data": None
-        }
+        except OverloadedError as e:
+            # Capacity ran out between the handler's check and the stream starting
+            outcome = "rejected"
+            summary = failed_response(str(e))
+        except DeadlineExceeded:
+            print(f"Deadline exceeded streaming {document}")
+            outcome = "timeout"
+            summary = failed_response("Processing did not finish before the request deadline")
+        except Exception as e:
+            print(f"Error streaming {document}: {str(e)}")
+            outcome = "failure"
+            summary = failed_response(str(e))
+    
+    REQUESTS.labels("stream", outcome).inc()
+    REQUEST_SECONDS.labels("stream").observe(time.perf_counter() - start)
+    if include_timings:
+        summary["timings"] = format_timings(timings, start)
+    yield "summary", summary
+
+@app.post("/extract-bill-data/stream", openapi_extra=BILL_REQUEST_BODIES)
+async def extract_bill_data_stream(http_request: Request):
+    """
+    Stream each PageData as soon as it is parsed, followed by a summary
+    record with the totals. NDJSON by default, Server-Sent Events when the
+    client sends Accept: text/event-stream
+    """
+    document, include_timings, form = await read_bill_request(http_request)
+    deadline = time.time() + REQUEST_DEADLINE_SECONDS
+    # Rejections have to happen before the 200 and the first record go out
+    try:
+        admission.ensure_capacity(deadline)
+    except OverloadedError as e:
+        REQUESTS.labels("stream", "rejected").inc()
+        if form is not None:
+            await form.close()
+        return overloaded_response(e)
+    # The upload must outlive the handler, so it is closed after the stream ends
+    background = BackgroundTask(form.close) if form is not None else None
+    
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        async def sse():
+            async for kind, record in stream_bill_records(document, include_timings, deadline):
+                yield b"event: %s\ndata: %s\n\n" % (kind.encode(), orjson.dumps(record))
+        return StreamingResponse(sse(), media_type="text/event-stream", background=background)
+    
+    async def ndjson():
+        async for kind, record in stream_bill_records(document, include_timings, deadline):
+            yield orjson.dumps({"type": kind, **record}) + b"\n"
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", background=background)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,48 @@
+"""Wall-clock scaling of PDF OCR with the number of worker processes.
+
+Usage:
+    python -m benchmarks.bench_pdf_ocr path/to/bill.pdf --workers 1 2 4 8
+"""
+import argparse
+import os
+import time
+
+from utils.image_processor import ImageProcessor
+
+
+def run(pdf_path, worker_counts, repeat=1):
+    """Time extract_text_from_pdf for each worker count"""
+    with open(pdf_path, 'rb') as f:
+        pdf_content = f.read()
+
+    processor = ImageProcessor()
+    results = []
+    for workers in worker_counts:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pages = processor.extract_text_from_pdf(pdf_content, workers=workers)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({"workers": workers, "pages": len(pages), "seconds": best})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf_path")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    results = run(args.pdf_path, args.workers, args.repeat)
+    baseline = results[0]["seconds"]
+    print(f"{'workers':>8} {'pages':>6} {'seconds':>9} {'pages/s':>8} {'speedup':>8}")
+    for row in results:
+        print(f"{row['workers']:>8} {row['pages']:>6} {row['seconds']:>9.2f} "
+              f"{row['pages'] / row['seconds']:>8.2f} {baseline / row['seconds']:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Synthetic hospital, pharmacy and final-bill documents with known line items.
+
+Pages use the hospital and pharmacy row layouts TextParser targets, so every generated page comes with the items the
+parser is expected to return. Text needs only the standard library;
+rendering images and PDFs needs Pillow.
+
+Usage:
+    python -m benchmarks.corpus out_dir --documents 20 --pages 5 --items 25 --dpi 150
+"""
+import argparse
+import json
+import os
+import random
+
+HOSPITAL_SERVICES = [
+    "Echocardiography", "Complete Blood Count", "Chest X Ray", "Nursing Charges",
+    "ICU Charges", "Oxygen Charges", "Physiotherapy Session", "Dressing Charges",
+    "ECG", "Lipid Profile", "Ultrasound Abdomen", "Doctor Visit", "Room Charges",
+    "Liver Function Test", "Blood Sugar Fasting", "CT Scan Brain",
+]
+PHARMACY_ITEMS = [
+    "Livi 300mg Tab", "Metnuro Tab", "Pizat Inj", "Supralite Os Syp", "CANNULA 22 NO",
+    "Pantop Inj", "Dolo 650mg Tab", "Augmentin 625mg Tab", "Ondem Syp", "Normal Saline 500ml",
+    "Betadine Ointment", "Insulin Syringe", "Glucon D Powder", "Cetrizine Tab",
+]
+FINAL_BILL_HEADS = [
+    "Room Charges", "Nursing Charges", "Consumables", "Investigation Charges",
+    "Procedure Charges", "Medical Equipment", "Doctor Visit Charges",
+]
+
+
+def _money(rng, low, high):
+    return round(rng.uniform(low, high), 2)
+
+
+def hospital_page(rng, items):
+    """Itemised bill detail page: '1. 15/11/2025 R1001 Echocardiography 1180.00 x 1.00 1180.00'"""
+    lines = [
+        "CITY CARE MULTISPECIALITY CENTRE",
+        "Patient Name: Test Patient",
+        f"Bill No: IP{rng.randint(10000, 99999)}",
+        "S.No Date Code Particulars Rate Qty Amount",
+    ]
+    expected = []
+    for i in range(1, items + 1):
+        name = rng.choice(HOSPITAL_SERVICES)
+        rate = _money(rng, 50, 5000)
+        quantity = float(rng.randint(1, 5))
+        amount = round(rate * quantity, 2)
+        lines.append(f"{i}. {rng.randint(1, 28):02d}/11/2025 R{rng.randint(1000, 9999)} {name} "
+                     f"{rate:.2f} x {quantity:.2f} {amount:.2f}")
+        expected.append({"item_name": name, "item_amount": amount, "item_rate": rate, "item_quantity": quantity})
+    lines.append(f"Sub Total {sum(item['item_amount'] for item in expected):.2f}")
+    return "\n".join(lines), "Bill Detail", expected
+
+
+def pharmacy_page(rng, items):
+    """Pharmacy table page: '1 3004 13825755 09/28 CANNULA 22 NO 1 105.00 0.00 105.00 5'"""
+    lines = [
+        "APOLLO PHARMACY CASH MEMO",
+        "Patient Name: Test Patient",
+        f"Bill No: PH{rng.randint(10000, 99999)}",
+        "S.No HSN Batch Exp Description Qty Rate Disc Amount GST",
+    ]
+    expected = []
+    for i in range(1, items + 1):
+        name = rng.choice(PHARMACY_ITEMS)
+        quantity = rng.randint(1, 20)
+        rate = _money(rng, 5, 900)
+        amount = round(rate * quantity, 2)
+        lines.append(f"{i} {rng.randint(3000, 3999)} {rng.randint(10000000, 99999999)} "
+                     f"{rng.randint(1, 12):02d}/{rng.randint(26, 30)} {name} {quantity} "
+                     f"{rate:.2f} 0.00 {amount:.2f} {rng.choice([5, 12, 18])}")
+        expected.append({"item_name": name, "item_amount": amount, "item_rate": None, "item_quantity": None})
+    lines.append(f"Net Amount {sum(item['item_amount'] for item in expected):.2f}")
+    return "\n".join(lines), "Pharmacy", expected
+
+
+def final_bill_page(rng, items):
+    """Summary page: '1. Room Charges 1500.00 x 3.00 4500.00' rows and a grand total"""
+    lines = ["FINAL BILL", "Patient Name: Test Patient", f"Bill No: FB{rng.randint(10000, 99999)}"]
+    expected = []
+    for i in range(1, items + 1):
+        name = FINAL_BILL_HEADS[(i - 1) % len(FINAL_BILL_HEADS)]
+        rate = _money(rng, 100, 20000)
+        quantity = float(rng.randint(1, 3))
+        amount = round(rate * quantity, 2)
+        lines.append(f"{i}. {name} {rate:.2f} x {quantity:.2f} {amount:.2f}")
+        expected.append({"item_name": name, "item_amount": amount, "item_rate": rate, "item_quantity": quantity})
+    lines.append(f"Grand Total {sum(item['item_amount'] for item in expected):.2f}")
+    return "\n".join(lines), "Final Bill", expected
+
+
+PAGE_KINDS = {"hospital": hospital_page, "pharmacy": pharmacy_page, "final": final_bill_page}
+
+
+def generate_document(seed, pages=3, items=20, kinds=None):
+    """List of {"page_no", "page_type", "text", "bill_items"} dicts"""
+    rng = random.Random(seed)
+    kinds = kinds or list(PAGE_KINDS)
+    document = []
+    for page_no in range(1, pages + 1):
+        text, page_type, expected = PAGE_KINDS[rng.choice(kinds)](rng, items)
+        document.append({"page_no": str(page_no), "page_type": page_type, "text": text, "bill_items": expected})
+    return document
+
+
+def render_page(text, dpi=150):
+    """Draw page text onto an A4 white PIL image at the given DPI"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    font_size = max(8, dpi // 8)
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", font_size)
+    except OSError:
+        font = ImageFont.load_default()
+
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    margin = dpi // 2
+    y = margin
+    for line in text.split("\n"):
+        draw.text((margin, y), line, fill=0, font=font)
+        y += int(font_size * 1.6)
+    return image
+
+
+def write_document(document, out_dir, name, dpi=150):
+    """Write <name>.pdf, one <name>-pN.png per page and <name>.json ground truth"""
+    images = [render_page(page["text"], dpi) for page in document]
+    pdf_path = os.path.join(out_dir, f"{name}.pdf")
+    images[0].save(pdf_path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+    for page, image in zip(document, images):
+        image.save(os.path.join(out_dir, f"{name}-p{page['page_no']}.png"))
+    with open(os.path.join(out_dir, f"{name}.json"), "w") as f:
+        json.dump(document, f, indent=1)
+    return pdf_path
+
+
+def generate_corpus(out_dir, documents=10, pages=3, items=20, dpi=150, seed=0, render=True):
+    """Write a corpus of documents to out_dir and return their names"""
+    os.makedirs(out_dir, exist_ok=True)
+    names = []
+    for index in range(documents):
+        name = f"bill-{index:04d}"
+        document = generate_document(seed + index, pages, items)
+        if render:
+            write_document(document, out_dir, name, dpi)
+        else:
+            with open(os.path.join(out_dir, f"{name}.json"), "w") as f:
+                json.dump(document, f, indent=1)
+        names.append(name)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--text-only", action="store_true", help="skip rendering images and PDFs")
+    args = parser.parse_args()
+
+    names = generate_corpus(args.out_dir, args.documents, args.pages, args.items,
+                            args.dpi, args.seed, render=not args.text_only)
+    print(f"Wrote {len(names)} documents to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""End-to-end load test of app:app against a local document server.
+
+Generates bill PDFs and page images with benchmarks.corpus, serves them
+from a local static HTTP server, starts the app under uvicorn once per
+configuration and drives POST /extract-bill-data with document URLs.
+Arrivals are open loop (Poisson at --rate requests/s, latency counted from
+each scheduled arrival) or, without --rate, closed loop (--concurrency
+clients back to back). Reports throughput, latency percentiles, error
+rate and the server's CPU and RSS over time as JSON that can be diffed
+between releases.
+
+Usage:
+    python -m benchmarks.loadtest --rate 2 --duration 60 --workers 1 2 --output load.json
+    python -m benchmarks.loadtest --concurrency 8 --config triage-off:PAGE_TRIAGE=off --config default:
+    python -m benchmarks.loadtest --compare before.json after.json --tolerance 0.2
+
+Each configuration is `name:ENV=value,ENV=value` and runs once per
+--workers count. Requests use distinct URLs and the OCR and download
+caches are off, so every request does the full work; pass --cache to
+measure the warm path instead.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.corpus import generate_corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Settings that make every request pay for its download and OCR
+COLD_SETTINGS = {"OCR_CACHE_ITEMS": "0", "DOWNLOAD_CACHE_MB": "0"}
+PERCENTILES = (50, 95, 99)
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_directory(directory):
+    """Static HTTP server for the corpus on a free port, running in a thread"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def process_tree(root_pid):
+    """Pids of a process and all its descendants, from /proc"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces; fields after it are fixed
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    pids, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, []))
+    return pids
+
+
+def tree_usage(root_pid):
+    """(CPU seconds, RSS bytes) of a process tree. CPU includes reaped children
+    (tesseract, poppler); RSS counts pages shared by forked workers once per process"""
+    cpu = rss = 0
+    for pid in process_tree(root_pid):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/statm") as f:
+                resident = int(f.read().split()[1])
+        except OSError:
+            continue
+        # utime, stime, cutime, cstime
+        cpu += sum(int(value) for value in fields[11:15])
+        rss += resident * PAGE_SIZE
+    return cpu / CLOCK_TICKS, rss
+
+
+class ResourceSampler:
+    """Samples the server's CPU use and RSS every `interval` seconds while a run is going"""
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.supported = os.path.isdir("/proc")
+
+    async def run(self, start, progress):
+        if not self.supported:
+            return
+        last_cpu, _ = tree_usage(self.pid)
+        last_time = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval)
+            cpu, rss = tree_usage(self.pid)
+            now = time.perf_counter()
+            self.samples.append({
+                "t": round(now - start, 2),
+                # 100 is one core fully busy
+                "cpu_percent": round(100 * (cpu - last_cpu) / (now - last_time), 1),
+                "rss_mib": round(rss / 2 ** 20, 1),
+                "completed": progress["completed"],
+                "in_flight": progress["in_flight"],
+            })
+            last_cpu, last_time = cpu, now
+
+    def summary(self):
+        if not self.samples:
+            return {"mean_cpu_percent": None, "peak_cpu_percent": None, "peak_rss_mib": None}
+        return {
+            "mean_cpu_percent": round(sum(s["cpu_percent"] for s in self.samples) / len(self.samples), 1),
+            "peak_cpu_percent": max(s["cpu_percent"] for s in self.samples),
+            "peak_rss_mib": max(s["rss_mib"] for s in self.samples),
+        }
+
+
+def start_app(workers, settings, ready_timeout):
+    """Start app:app under uvicorn and wait for /health/ready; returns (process, base URL)"""
+    import urllib.request
+    from urllib.error import URLError
+
+    port = free_port()
+    env = dict(os.environ, **settings)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + ready_timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise Exception(f"Failed to start app: uvicorn exited with {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/health/ready", timeout=2) as response:
+                if response.status == 200:
+                    return server, base_url
+        except URLError as e:
+            body = getattr(e, "read", lambda: b"")()
+            if b'"failed"' in body:
+                stop_app(server)
+                raise Exception(f"Failed to start app: warm-up failed: {body.decode()}")
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_app(server)
+    raise Exception(f"Failed to start app: not ready after {ready_timeout} s")
+
+
+def stop_app(server):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+async def drive(base_url, documents, args, pid):
+    """Send the load and return the per-request records and resource samples"""
+    import aiohttp
+
+    records = []
+    progress = {"completed": 0, "in_flight": 0}
+    counter = iter(range(10 ** 9))
+    rng = random.Random(args.seed)
+
+    async def one_request(session, scheduled):
+        number = next(counter)
+        url = documents[number % len(documents)]
+        if not args.cache:
+            url = f"{url}?request={number}"
+        progress["in_flight"] += 1
+        status, success, error = None, False, None
+        try:
+            async with session.post(f"{base_url}/extract-bill-data", json={"document": url}) as response:
+                status = response.status
+                body = await response.json(content_type=None)
+                success = status == 200 and body.get("is_success") is True
+                if not success:
+                    error = body.get("error") or body.get("detail")
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        finally:
+            progress["in_flight"] -= 1
+            progress["completed"] += 1
+        records.append({"latency": time.perf_counter() - scheduled, "status": status,
+                        "success": success, "error": error})
+
+    sampler = ResourceSampler(pid, args.sample_interval)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        start = time.perf_counter()
+        sampling = asyncio.create_task(sampler.run(start, progress))
+        end = start + args.duration
+        if args.rate:
+            # Open loop: arrivals keep their schedule however slow the server gets
+            tasks = []
+            arrival = start
+            while True:
+                arrival += rng.expovariate(args.rate)
+                if arrival >= end:
+                    break
+                await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+                tasks.append(asyncio.create_task(one_request(session, arrival)))
+            await asyncio.gather(*tasks)
+        else:
+            async def client():
+                while time.perf_counter() < end:
+                    await one_request(session, time.perf_counter())
+            await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        sampling.cancel()
+        await asyncio.gather(sampling, return_exceptions=True)
+    return records, elapsed, sampler
+
+
+def summarize(records, elapsed):
+    """Throughput, latency percentiles and error breakdown of one run"""
+    ok = [r["latency"] for r in records if r["success"]]
+    errors = {}
+    for r in records:
+        if not r["success"]:
+            # "200" with is_success false is a document the app failed to process
+            key = "client" if r["status"] is None else "failed" if r["status"] == 200 else str(r["status"])
+            errors[key] = errors.get(key, 0) + 1
+    summary = {
+        "requests": len(records),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(1 - len(ok) / len(records), 4) if records else None,
+        "errors_by_status": dict(sorted(errors.items())),
+        "latency_seconds": {f"p{p}": None if not ok else round(percentile(ok, p), 3) for p in PERCENTILES},
+    }
+    summary["latency_seconds"]["mean"] = round(sum(ok) / len(ok), 3) if ok else None
+    summary["latency_seconds"]["max"] = round(max(ok), 3) if ok else None
+    return summary
+
+
+def parse_config(text):
+    """`name:ENV=value,ENV=value` -> (name, settings)"""
+    name, _, assignments = text.partition(":")
+    settings = {}
+    for assignment in filter(None, assignments.split(",")):
+        key, _, value = assignment.partition("=")
+        settings[key.strip()] = value.strip()
+    return name or "default", settings
+
+
+def run_config(name, settings, workers, documents, args):
+    print(f"Running {name} with {workers} worker(s) for {args.duration} s", file=sys.stderr)
+    server, base_url = start_app(workers, settings, args.ready_timeout)
+    try:
+        records, elapsed, sampler = asyncio.run(drive(base_url, documents, args, server.pid))
+    finally:
+        stop_app(server)
+    errors = sorted({r["error"] for r in records if r["error"]})
+    return {
+        "name": f"{name}/workers={workers}",
+        "workers": workers,
+        "settings": settings,
+        **summarize(records, elapsed),
+        **sampler.summary(),
+        "sample_errors": errors[:5],
+        "resources": sampler.samples,
+    }
+
+
+def compare(before, after, tolerance):
+    """Print throughput, p95 and error rate changes per run; list regressions beyond the tolerance"""
+    previous = {run["name"]: run for run in before["runs"]}
+    regressions = []
+    for run in after["runs"]:
+        old = previous.get(run["name"])
+        if old is None:
+            print(f"{run['name']:40} new run")
+            continue
+        checks = [
+            ("throughput_rps", old["throughput_rps"], run["throughput_rps"], True),
+            ("p95", old["latency_seconds"]["p95"], run["latency_seconds"]["p95"], False),
+            ("error_rate", old["error_rate"], run["error_rate"], False),
+        ]
+        for metric, was, now, higher_is_better in checks:
+            if was is None or now is None:
+                continue
+            if was:
+                change = (now - was) / was
+            else:
+                change = 0.0 if not now else math.inf
+            worse = -change if higher_is_better else change
+            status = "REGRESSION" if worse > tolerance else "ok"
+            print(f"{run['name']:40} {metric:15} {was:>10} -> {now:>10} {change:+.1%} {status}")
+            if worse > tolerance:
+                regressions.append(f"{run['name']} {metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, help="open loop arrivals per second (default: closed loop)")
+    parser.add_argument("--concurrency", type=int, default=4, help="closed loop clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of arrivals per run")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="uvicorn worker counts to compare")
+    parser.add_argument("--config", action="append", default=[], metavar="NAME:ENV=VALUE,...",
+                        help="app settings to compare; repeat for several")
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--kinds", nargs="+", choices=["pdf", "png"], default=["pdf", "png"],
+                        help="serve whole PDFs, single page images or both")
+    parser.add_argument("--cache", action="store_true", help="leave the OCR and download caches on")
+    parser.add_argument("--timeout", type=float, default=300, help="client timeout per request")
+    parser.add_argument("--ready-timeout", type=float, default=120)
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results JSON here as well as to stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="diff two result files")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression in --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        results = []
+        for path in args.compare:
+            with open(path) as f:
+                results.append(json.load(f))
+        regressions = compare(*results, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+        return
+
+    configs = [parse_config(text) for text in args.config] or [("default", {})]
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        names = generate_corpus(corpus_dir, documents=args.documents, pages=args.pages, items=args.items,
+                                seed=args.seed)
+        static = serve_directory(corpus_dir)
+        base = f"http://127.0.0.1:{static.server_address[1]}"
+        documents = []
+        if "pdf" in args.kinds:
+            documents += [f"{base}/{name}.pdf" for name in names]
+        if "png" in args.kinds:
+            documents += [f"{base}/{name}-p{page}.png" for name in names for page in range(1, args.pages + 1)]
+        try:
+            runs = []
+            for name, settings in configs:
+                settings = settings if args.cache else dict(COLD_SETTINGS, **settings)
+                for workers in args.workers:
+                    runs.append(run_config(name, settings, workers, documents, args))
+        finally:
+            static.shutdown()
+            static.server_close()
+
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "load": {
+            "mode": "open" if args.rate else "closed",
+            "rate": args.rate,
+            "concurrency": None if args.rate else args.concurrency,
+            "duration": args.duration,
+            "documents": len(documents),
+            "pages": args.pages,
+            "items": args.items,
+            "kinds": args.kinds,
+            "cache": args.cache,
+        },
+        "runs": runs,
+    }
+    text = json.dumps(results, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Benchmark suite for TextParser and ImageProcessor on the synthetic corpus.
+
+Reports app startup time, parser lines/second, batch re-parse speedup, response encoding
+items/second, OCR pages/second, tesseract time per page with and without
+image preprocessing and memory peaks, and compares them with a saved
+baseline so regressions fail loudly.
+
+Usage:
+    python -m benchmarks.run                      # run and print results
+    python -m benchmarks.run --save-baseline      # store results in baselines.json
+    python -m benchmarks.run --check              # exit 1 on regressions beyond --tolerance
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.corpus import generate_document, render_page
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+def result(value, unit, higher_is_better=True):
+    return {"value": round(value, 3), "unit": unit, "higher_is_better": higher_is_better}
+
+
+def best_of(repeat, func):
+    """Fastest wall-clock time of `repeat` calls"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_parser(pages=200, items=40, repeat=3):
+    """Lines/second and peak Python allocation of TextParser over generated pages"""
+    from utils.text_parser import TextParser
+
+    parser = TextParser()
+    texts = [page["text"] for page in generate_document(seed=1, pages=pages, items=items)]
+    line_count = sum(text.count("\n") + 1 for text in texts)
+
+    def parse_all():
+        for text in texts:
+            parser.detect_page_type(text)
+            parser.parse_line_items(text)
+
+    seconds = best_of(repeat, parse_all)
+
+    tracemalloc.start()
+    parse_all()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "parser_lines_per_second": result(line_count / seconds, "lines/s"),
+        "parser_peak_kib": result(peak / 1024, "KiB", higher_is_better=False),
+    }
+
+
+def bench_batch_parse(pages=1000, items=40, repeat=5):
+    """Pages/second re-parsing stored page text with TextParser.parse_pages, and its
+    speedup over parse_line_items page by page, in one process and across all CPUs"""
+    from utils.text_parser import TextParser
+
+    parser = TextParser()
+    document = generate_document(seed=6, pages=pages, items=items)
+    texts = {(f"doc{index // 5}", page["page_no"]): page["text"] for index, page in enumerate(document)}
+
+    def per_page():
+        return {key: parser.parse_line_items(text) for key, text in texts.items()}
+
+    loop = best_of(repeat, per_page)
+    batch = best_of(repeat, lambda: parser.parse_pages(texts))
+    results = {
+        "batch_parse_pages_per_second": result(pages / batch, "pages/s"),
+        "batch_parse_speedup": result(loop / batch, "x"),
+    }
+    workers = os.cpu_count() or 1
+    if workers > 1:
+        parallel = best_of(repeat, lambda: parser.parse_pages(texts, workers=workers))
+        results["batch_parse_parallel_speedup"] = result(loop / parallel, "x")
+    return results
+
+
+def bench_response(pages=50, items=100, repeat=3):
+    """Items/second from parsed pages to response bytes (pool pickling plus encoding)
+    and peak allocation while parsing them"""
+    import pickle
+
+    from fastapi.responses import ORJSONResponse
+    from utils.pipeline import BillPipeline, parse_page
+
+    document = generate_document(seed=4, pages=pages, items=items)
+    pipeline = BillPipeline(ocr_workers=1, io_workers=1)
+
+    def parse_all():
+        return [parse_page(page["page_no"], page["text"]) for page in document]
+
+    parsed = parse_all()
+    item_count = sum(len(page["bill_items"]) for page in parsed)
+
+    def encode():
+        # Pages cross the process pool boundary before the response is built
+        received = [pickle.loads(pickle.dumps(page)) for page in parsed]
+        return ORJSONResponse({"is_success": True, "data": pipeline.build_response_data(received)}).body
+
+    seconds = best_of(repeat, encode)
+
+    tracemalloc.start()
+    parse_all()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "response_items_per_second": result(item_count / seconds, "items/s"),
+        "response_parse_peak_kib": result(peak / 1024, "KiB", higher_is_better=False),
+    }
+
+
+def bench_ocr(pages=4, items=25, dpi=150, repeat=1):
+    """Pages/second of ImageProcessor on rendered images and PDFs, OCR cache disabled"""
+    if not shutil.which("tesseract") or not shutil.which("pdftoppm"):
+        print("Skipping OCR benchmarks: tesseract or poppler is not installed", file=sys.stderr)
+        return {}
+
+    from utils.image_processor import ImageProcessor
+    from utils.ocr_cache import OCRCache
+
+    document = generate_document(seed=2, pages=pages, items=items)
+    images = [render_page(page["text"], dpi) for page in document]
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "bench.pdf")
+        png_path = os.path.join(tmp, "bench.png")
+        images[0].save(pdf_path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+        images[0].save(png_path)
+        with open(pdf_path, "rb") as f:
+            pdf_content = f.read()
+        with open(png_path, "rb") as f:
+            png_content = f.read()
+
+    def processor():
+        # A fresh zero-size cache per run so every page really goes through tesseract
+        return ImageProcessor(cache=OCRCache(memory_items=0))
+
+    pdf_seconds = best_of(repeat, lambda: processor().extract_text_from_pdf(pdf_content))
+    image_seconds = best_of(repeat, lambda: processor().extract_text_from_image(png_content))
+
+    return {
+        "ocr_pdf_pages_per_second": result(pages / pdf_seconds, "pages/s"),
+        "ocr_image_pages_per_second": result(1 / image_seconds, "pages/s"),
+        "ocr_peak_rss_mib": result(peak_rss_mib(), "MiB", higher_is_better=False),
+    }
+
+
+def phone_photo(text, dpi=300, skew=2.0):
+    """A rendered page made to look like a phone photo: big, colour, tilted, grey paper"""
+    from PIL import ImageOps
+
+    page = render_page(text, dpi).rotate(skew, expand=True, fillcolor=255)
+    return ImageOps.colorize(page, black=(40, 35, 30), white=(215, 210, 195)).resize(
+        (int(page.width * 1.3), int(page.height * 1.3))
+    )
+
+
+def bench_preprocess(pages=3, items=25):
+    """Seconds per page spent preprocessing, and tesseract seconds per page with and without it"""
+    import pytesseract
+
+    from utils.preprocess import PREPROCESS_STEPS, preprocess
+
+    images = [phone_photo(page["text"]) for page in generate_document(seed=4, pages=pages, items=items)]
+    results = {
+        "preprocess_seconds_per_page": result(
+            best_of(3, lambda: [preprocess(image, PREPROCESS_STEPS) for image in images]) / pages,
+            "s/page", higher_is_better=False
+        ),
+    }
+    if not shutil.which("tesseract"):
+        print("Skipping tesseract timings: tesseract is not installed", file=sys.stderr)
+        return results
+
+    prepared = [preprocess(image, PREPROCESS_STEPS) for image in images]
+    raw = best_of(1, lambda: [pytesseract.image_to_string(image) for image in images])
+    cleaned = best_of(1, lambda: [pytesseract.image_to_string(image) for image in prepared])
+    results["ocr_raw_seconds_per_page"] = result(raw / pages, "s/page", higher_is_better=False)
+    results["ocr_preprocessed_seconds_per_page"] = result(cleaned / pages, "s/page", higher_is_better=False)
+    return results
+
+
+def bench_ocr_backends(receipts=5, items=6):
+    """Seconds per small receipt for each OCR backend that is installed"""
+    if not shutil.which("tesseract"):
+        print("Skipping OCR backend benchmarks: tesseract is not installed", file=sys.stderr)
+        return {}
+
+    from utils.image_processor import OCR_CONFIG, OCR_LANG
+    from utils.ocr_backend import create_backend
+
+    images = [render_page(page["text"], 150).crop((0, 0, 1240, 500))
+              for page in generate_document(seed=6, pages=receipts, items=items, kinds=["pharmacy"])]
+    results = {}
+    for kind in ("pytesseract", "tesserocr"):
+        backend = create_backend(kind)
+        if backend.engine_name(OCR_LANG, OCR_CONFIG) != kind:
+            continue
+        backend.warm_up(OCR_LANG, OCR_CONFIG)
+        seconds = best_of(1, lambda: [backend.image_to_string(image, OCR_LANG, OCR_CONFIG) for image in images])
+        results[f"ocr_{kind}_seconds_per_receipt"] = result(seconds / receipts, "s/page", higher_is_better=False)
+    return results
+
+
+# Run in a fresh interpreter: time to import the app, then optionally to warm it up
+STARTUP_PROBE = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import app
+result = {"import": time.perf_counter() - start}
+if "--warm-up" in sys.argv:
+    start = time.perf_counter()
+    asyncio.run(app.pipeline.warm_up())
+    result["warm_up"] = time.perf_counter() - start
+    app.pipeline.shutdown()
+print(json.dumps(result))
+"""
+
+
+def startup_probe(*args):
+    output = subprocess.run([sys.executable, "-c", STARTUP_PROBE, *args],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def bench_startup(repeat=3):
+    """Seconds for a fresh interpreter to import the app, and to warm up its OCR workers"""
+    results = {
+        "startup_import_seconds": result(
+            min(startup_probe()["import"] for _ in range(repeat)), "s", higher_is_better=False
+        ),
+    }
+    if not shutil.which("tesseract"):
+        print("Skipping warm-up timing: tesseract is not installed", file=sys.stderr)
+        return results
+    results["startup_warm_up_seconds"] = result(startup_probe("--warm-up")["warm_up"], "s", higher_is_better=False)
+    return results
+
+
+def peak_rss_mib():
+    """Peak resident memory of this process and its finished children (tesseract, poppler)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return max(own, children) / scale
+
+
+BENCHMARKS = {
+    "parser": bench_parser,
+    "batch_parse": bench_batch_parse,
+    "response": bench_response,
+    "preprocess": bench_preprocess,
+    "ocr": bench_ocr,
+    "backends": bench_ocr_backends,
+    "startup": bench_startup,
+}
+
+
+def run(names):
+    results = {}
+    for name in names:
+        results.update(BENCHMARKS[name]())
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "benchmarks": results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """List of human readable regressions beyond the relative tolerance"""
+    regressions = []
+    for name, now in current["benchmarks"].items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if not before or not before["value"]:
+            continue
+        change = (now["value"] - before["value"]) / before["value"]
+        worse = -change if now["higher_is_better"] else change
+        status = "REGRESSION" if worse > tolerance else "ok"
+        print(f"{name:32} {before['value']:>12} -> {now['value']:>12} {now['unit']:8} {change:+.1%} {status}")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    current = run(args.only)
+    print(json.dumps(current, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
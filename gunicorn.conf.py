@@ -0,0 +1,46 @@
+"""Multi-worker launch mode: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master, together with the OCR stack and the
+parser's keyword automaton, and workers fork with all of it already loaded.
+Each worker then warms its own OCR process pool; size it with OCR_WORKERS so
+WEB_CONCURRENCY * OCR_WORKERS matches the cores.
+
+Each worker keeps its own metrics, so /metrics runs in prometheus_client's
+multiprocess mode: workers write to PROMETHEUS_MULTIPROC_DIR (a fresh temp
+folder unless set) and any worker's /metrics reports the sum.
+"""
+import glob
+import os
+import tempfile
+
+# Must be set before prometheus_client is imported, i.e. before the app loads
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="bill-metrics-"))
+# Files left by a previous run would be added to this one's counts
+for stale in glob.glob(os.path.join(metrics_dir, "*.db")):
+    os.remove(stale)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Long scanned PDFs can keep a request busy for minutes
+timeout = int(os.environ.get("WORKER_TIMEOUT", 300))
+graceful_timeout = 30
+
+
+def on_starting(server):
+    """Load shared state in the master, before any worker forks"""
+    from utils.image_processor import import_ocr_modules
+    from utils.keyword_matcher import get_default_matcher
+
+    import_ocr_modules()
+    get_default_matcher()
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the summed metrics"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.admission import AdmissionController, OverloadedError
+from utils.deadline import DeadlineExceeded
+
+
+async def hold(controller, release, order, name, deadline=None):
+    async with controller.admit(deadline):
+        order.append(name)
+        await release.wait()
+
+
+def test_queue_in_arrival_order_and_reject_past_capacity():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queued=2)
+        release = asyncio.Event()
+        order = []
+        tasks = [asyncio.create_task(hold(controller, release, order, name)) for name in "abc"]
+        await asyncio.sleep(0)
+        assert (controller.active, controller.queued) == (1, 2)
+
+        with pytest.raises(OverloadedError) as rejected:
+            async with controller.admit():
+                pass
+        assert rejected.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "c"]
+        assert (controller.active, controller.queued) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_waits_that_would_outlast_the_deadline_are_refused():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queued=4)
+        controller.service_seconds = 10.0
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(controller, release, [], "a"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(OverloadedError):
+            async with controller.admit(time.time() + 1):
+                pass
+        release.set()
+        await running
+
+    asyncio.run(scenario())
+
+
+def test_deadline_passing_in_the_queue_and_cancelled_waiters_free_their_place():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queued=4)
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(controller, release, [], "a"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(DeadlineExceeded):
+            await hold(controller, release, [], "late", time.time() + 0.05)
+        cancelled = asyncio.create_task(hold(controller, release, [], "gone"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert controller.queued == 0
+
+        release.set()
+        await running
+        assert controller.active == 0
+
+    asyncio.run(scenario())
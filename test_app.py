@@ -0,0 +1,326 @@
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app  # noqa: E402
+from utils.admission import AdmissionController  # noqa: E402
+from utils.document_source import InlineDocument  # noqa: E402
+from utils.line_item import LineItem  # noqa: E402
+
+PAGES = [{
+    "page_no": "1",
+    "page_type": "Pharmacy",
+    "bill_items": [
+        LineItem("Livi 300mg Tab", 448.0, 32.0, 14.0),
+        LineItem("Metnuro", 124.03),
+    ],
+}]
+
+
+@pytest.fixture(autouse=True)
+def roomy_admission(monkeypatch):
+    # Fresh controller per test, large enough that only the admission tests hit its limits
+    monkeypatch.setattr(app, "admission", AdmissionController(max_active=16, max_queued=16))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_process(document, timings=None, deadline=None):
+        await asyncio.sleep(0.01)
+        if "broken" in document:
+            raise Exception("Failed to read local file")
+        return PAGES
+
+    monkeypatch.setattr(app.pipeline, "process", fake_process)
+    return TestClient(app.app)
+
+
+def test_extract_bill_data(client):
+    body = client.post("/extract-bill-data", json={"document": "bill.pdf"}).json()
+    assert body["is_success"] is True
+    assert body["data"]["total_item_count"] == 2
+    assert body["data"]["reconciled_amount"] == 572.03
+    assert body["data"]["pagewise_line_items"][0]["bill_items"][1] == {
+        "item_name": "Metnuro", "item_amount": 124.03, "item_rate": None, "item_quantity": None
+    }
+    # The orjson fast path still produces exactly the declared response model
+    assert app.BillResponse.parse_obj(body).dict(exclude_unset=True) == body
+    schema = client.get("/openapi.json").json()["paths"]["/extract-bill-data"]["post"]["responses"]["200"]
+    assert schema["content"]["application/json"]["schema"] == {"$ref": "#/components/schemas/BillResponse"}
+
+
+def stub_read_pdf_page(pdf_path, page_number, timings=None, should_skip=None):
+    """Stands in for OCR inside the pool workers: later pages finish first, page 3 of a FAIL PDF crashes"""
+    time.sleep((4 - page_number) * 0.05)
+    with open(pdf_path, "rb") as f:
+        if b"FAIL" in f.read() and page_number == 3:
+            raise Exception("Failed to OCR page: tesseract crashed")
+    return f"{page_number} Livi 300mg Tab 14 32.00 448.00", "ocr"
+
+
+def test_pages_run_in_the_process_pool_and_come_back_in_order(monkeypatch):
+    from utils import pipeline as pipeline_module
+    from utils.image_processor import ImageProcessor
+    from utils.ocr_cache import OCRCache
+
+    # Pool workers fork after these patches, so they run the stub
+    monkeypatch.setattr(pipeline_module, "read_pdf_page", stub_read_pdf_page)
+    monkeypatch.setattr(pipeline_module, "count_pdf_pages", lambda path: 3)
+    pool_pipeline = pipeline_module.BillPipeline(ocr_workers=2, io_workers=2, page_window=3)
+    pool_pipeline.processor = ImageProcessor(cache=OCRCache())
+    monkeypatch.setattr(app, "pipeline", pool_pipeline)
+    client = TestClient(app.app)
+
+    def extract(content):
+        encoded = base64.b64encode(content).decode()
+        return client.post("/extract-bill-data", json={"content": encoded, "filename": "bill.pdf"}).json()
+
+    try:
+        body = extract(b"%PDF-1.4 three pages")
+        failed = extract(b"%PDF-1.4 FAIL")
+    finally:
+        pool_pipeline.shutdown()
+
+    pages = body["data"]["pagewise_line_items"]
+    assert [page["page_no"] for page in pages] == ["1", "2", "3"]
+    assert [page["bill_items"][0]["item_name"] for page in pages] == ["Livi 300mg Tab"] * 3
+    assert failed["is_success"] is False and failed["data"] is None
+    assert "tesseract crashed" in failed["error"]
+
+
+def test_timings_only_when_requested(client):
+    assert "timings" not in client.post("/extract-bill-data", json={"document": "bill.pdf"}).json()
+    body = client.post("/extract-bill-data", json={"document": "bill.pdf", "include_timings": True}).json()
+    assert body["timings"]["total"] > 0
+
+
+def test_inline_base64_and_multipart_uploads(monkeypatch):
+    received = []
+
+    async def recording_process(document, timings=None, deadline=None):
+        received.append(document)
+        return PAGES
+
+    monkeypatch.setattr(app.pipeline, "process", recording_process)
+    client = TestClient(app.app)
+    encoded = base64.b64encode(b"%PDF-1.4 bill").decode()
+
+    body = client.post("/extract-bill-data", json={"content": encoded, "filename": "bill.pdf"}).json()
+    assert body["is_success"] is True
+    body = client.post(
+        "/extract-bill-data", files={"file": ("scan.png", b"\x89PNG data", "image/png")},
+        data={"include_timings": "true"}
+    ).json()
+    assert body["is_success"] is True and "timings" in body
+
+    assert [type(document) for document in received] == [InlineDocument, InlineDocument]
+    assert received[0].base64_content == encoded
+    assert received[1].name == "scan.png"
+
+
+def test_undecodable_base64_is_a_bad_request():
+    response = TestClient(app.app).post("/extract-bill-data", json={"content": "JVBERi0x!!not*base64"})
+    assert response.status_code == 400
+    assert response.json()["is_success"] is False
+    assert "Failed to decode base64 document" in response.json()["error"]
+
+
+def test_bad_requests_are_rejected(client):
+    assert client.post("/extract-bill-data", json={}).status_code == 422
+    assert client.post("/extract-bill-data", json={"document": "a.pdf", "content": "JVBERi0="}).status_code == 422
+    assert client.post("/extract-bill-data", content=b"{not json", headers={"content-type": "application/json"}).status_code == 422
+    assert client.post("/extract-bill-data", files={"other": ("a.txt", b"x")}).status_code == 422
+    assert client.get("/openapi.json").status_code == 200
+
+
+def test_app_import_defers_the_ocr_stack():
+    code = "import sys, app; print(','.join(sorted(set(sys.argv[1:]) & set(sys.modules))))"
+    heavy = ["numpy", "PIL", "pdf2image", "pytesseract", "tesserocr", "requests", "aiohttp"]
+    loaded = subprocess.run([sys.executable, "-c", code, *heavy], capture_output=True, text=True, check=True)
+    assert loaded.stdout.strip() == ""
+
+
+def wait_for_readiness(client):
+    for _ in range(100):
+        response = client.get("/health/ready")
+        if response.status_code == 200 or response.json()["status"] == "failed":
+            return response
+        time.sleep(0.01)
+    return response
+
+
+def test_ready_only_after_warm_up(monkeypatch):
+    warmed = asyncio.Event()
+
+    async def fake_warm_up():
+        await warmed.wait()
+        return 2
+
+    monkeypatch.setattr(app.pipeline, "warm_up", fake_warm_up)
+    monkeypatch.setattr(app, "readiness", dict(app.readiness, status="warming_up"))
+    with TestClient(app.app) as client:
+        assert client.get("/health/live").json() == {"status": "alive"}
+        assert client.get("/health/ready").status_code == 503
+        client.portal.call(warmed.set)
+        body = wait_for_readiness(client).json()
+    assert body["status"] == "ready" and body["ocr_workers"] == 2
+
+
+def test_failed_warm_up_is_not_ready(monkeypatch):
+    async def broken_warm_up():
+        raise Exception("tesseract is not installed")
+
+    monkeypatch.setattr(app.pipeline, "warm_up", broken_warm_up)
+    monkeypatch.setattr(app, "readiness", dict(app.readiness, status="warming_up"))
+    with TestClient(app.app) as client:
+        response = wait_for_readiness(client)
+        assert client.get("/health/live").status_code == 200
+    assert response.status_code == 503
+    assert response.json()["error"] == "tesseract is not installed"
+
+
+def test_metrics_endpoint(client):
+    client.post("/extract-bill-data", json={"document": "bill.pdf"})
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'bill_requests_total{endpoint="extract",outcome="success"}' in response.text
+    assert "bill_requests_in_flight 0.0" in response.text
+    assert "bill_request_seconds_bucket" in response.text
+
+
+def test_metrics_are_summed_across_gunicorn_workers(tmp_path):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    worker = "from utils.metrics import IN_FLIGHT, REQUESTS; REQUESTS.labels('extract', 'success').inc(); IN_FLIGHT.inc()"
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], env=env, check=True)
+    scrape = "from utils.metrics import latest; print(latest()[0].decode())"
+    text = subprocess.run([sys.executable, "-c", scrape], env=env, check=True, capture_output=True, text=True).stdout
+    assert 'bill_requests_total{endpoint="extract",outcome="success"} 2.0' in text
+
+
+def test_batch_keeps_order_and_per_document_failures(client):
+    documents = [{"document": "a.pdf"}, {"document": "broken.pdf"}, {"document": "c.png"}]
+    body = client.post("/extract-bill-data/batch", json={"documents": documents}).json()
+    assert [r["is_success"] for r in body["results"]] == [True, False, True]
+    assert body["results"][1]["data"] is None
+
+
+def test_batch_respects_concurrency_limit(monkeypatch):
+    in_flight = 0
+    peak = 0
+
+    async def tracking_process(document, timings=None, deadline=None):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return PAGES
+
+    monkeypatch.setattr(app.pipeline, "process", tracking_process)
+    monkeypatch.setattr(app, "BATCH_CONCURRENCY", 3)
+    documents = [{"document": f"{i}.pdf"} for i in range(12)]
+    body = TestClient(app.app).post("/extract-bill-data/batch", json={"documents": documents}).json()
+    assert len(body["results"]) == 12
+    assert peak == 3
+
+
+def test_stream_sends_pages_then_summary(monkeypatch):
+    async def fake_iter_pages(document, timings=None, deadline=None):
+        for page_no in ("1", "2"):
+            yield dict(PAGES[0], page_no=page_no)
+
+    monkeypatch.setattr(app.pipeline, "iter_pages", fake_iter_pages)
+    response = TestClient(app.app).post("/extract-bill-data/stream", json={"document": "bill.pdf"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["type"] for r in records] == ["page", "page", "summary"]
+    assert [r["page_no"] for r in records[:2]] == ["1", "2"]
+    assert records[-1]["is_success"] is True
+    assert records[-1]["data"] == {
+        "total_item_count": 4, "reconciled_amount": 1144.06, "skipped_pages": [], "triage_seconds_saved": 0.0
+    }
+
+
+def test_stream_as_server_sent_events(monkeypatch):
+    async def failing_iter_pages(document, timings=None, deadline=None):
+        yield PAGES[0]
+        raise Exception("Failed to extract text from PDF")
+
+    monkeypatch.setattr(app.pipeline, "iter_pages", failing_iter_pages)
+    response = TestClient(app.app).post(
+        "/extract-bill-data/stream", json={"document": "bill.pdf"},
+        headers={"Accept": "text/event-stream"}
+    )
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [event[0] for event in events] == ["event: page", "event: summary"]
+    assert json.loads(events[-1][1][len("data: "):])["is_success"] is False
+
+
+def test_rejects_with_retry_after_when_full(monkeypatch):
+    async def slow_process(document, timings=None, deadline=None):
+        await release.wait()
+        return PAGES
+
+    monkeypatch.setattr(app.pipeline, "process", slow_process)
+    monkeypatch.setattr(app, "admission", AdmissionController(max_active=1, max_queued=0))
+    with TestClient(app.app) as client:
+        release = client.portal.call(asyncio.Event)
+        responses = {}
+        first = threading.Thread(
+            target=lambda: responses.update(first=client.post("/extract-bill-data", json={"document": "a.pdf"}))
+        )
+        first.start()
+        while app.admission.active == 0:
+            time.sleep(0.01)
+
+        rejected = client.post("/extract-bill-data", json={"document": "b.pdf"})
+        assert rejected.status_code == 429
+        assert int(rejected.headers["Retry-After"]) >= 1
+        assert rejected.json()["is_success"] is False and "capacity" in rejected.json()["error"]
+        assert client.post("/extract-bill-data/stream", json={"document": "b.pdf"}).status_code == 429
+
+        client.portal.call(release.set)
+        first.join()
+        assert responses["first"].status_code == 200
+    assert app.admission.active == 0
+
+
+def test_deadline_gives_explicit_error_not_data(monkeypatch):
+    async def stuck_process(document, timings=None, deadline=None):
+        await asyncio.sleep(max(0, deadline - time.time()))
+        raise app.DeadlineExceeded("deadline")
+
+    monkeypatch.setattr(app.pipeline, "process", stuck_process)
+    monkeypatch.setattr(app, "REQUEST_DEADLINE_SECONDS", 0.05)
+    response = TestClient(app.app).post("/extract-bill-data", json={"document": "bill.pdf"})
+    assert response.status_code == 504
+    body = response.json()
+    assert body["is_success"] is False and body["data"] is None
+    assert "deadline" in body["error"]
+
+
+def test_lone_batch_larger_than_admission_capacity_succeeds(monkeypatch):
+    async def slow_process(document, timings=None, deadline=None):
+        await asyncio.sleep(0.05)
+        return PAGES
+
+    monkeypatch.setattr(app.pipeline, "process", slow_process)
+    monkeypatch.setattr(app, "admission", AdmissionController(max_active=1, max_queued=2))
+    monkeypatch.setattr(app, "BATCH_CONCURRENCY", 8)
+    documents = [{"document": f"{i}.pdf"} for i in range(8)]
+    body = TestClient(app.app).post("/extract-bill-data/batch", json={"documents": documents}).json()
+    assert [r["is_success"] for r in body["results"]] == [True] * 8
+    assert app.admission.active == 0 and app.admission.queued == 0
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from utils.deadline import DeadlineExceeded, DeadlineTable, init_worker_deadlines, worker_task
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "killpg"), reason="needs POSIX process groups")
+
+
+def run_subprocess(seconds, token):
+    with worker_task(token):
+        subprocess.run(["sleep", str(seconds)], check=True)
+        return os.getpid()
+
+
+def fail_like_pytesseract(token):
+    class UnpicklableError(EnvironmentError):
+        def __init__(self):
+            super().__init__("tesseract is not installed")
+
+    with worker_task(token):
+        raise UnpicklableError()
+
+
+@pytest.fixture
+def pool():
+    table = DeadlineTable(slots=4)
+    with ProcessPoolExecutor(max_workers=1, initializer=init_worker_deadlines, initargs=(table,)) as executor:
+        yield table, executor
+
+
+def test_deadline_kills_running_subprocess(pool):
+    table, executor = pool
+    token = table.acquire(time.time() + 0.3)
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        executor.submit(run_subprocess, 30, token).result(timeout=10)
+    assert time.perf_counter() - start < 5
+    # The worker survives and serves the next request
+    assert executor.submit(run_subprocess, 0, table.acquire(None)).result(timeout=10) > 0
+
+
+def test_released_request_is_stopped_and_later_work_skipped(pool):
+    table, executor = pool
+    token = table.acquire(None)
+    running = executor.submit(run_subprocess, 30, token)
+    queued = executor.submit(run_subprocess, 30, token)
+    threading.Timer(0.3, table.release, [token]).start()
+    with pytest.raises(DeadlineExceeded):
+        running.result(timeout=10)
+    with pytest.raises(DeadlineExceeded):
+        queued.result(timeout=10)
+
+
+def test_worker_errors_come_back_without_breaking_the_pool(pool):
+    table, executor = pool
+    with pytest.raises(Exception, match="tesseract is not installed"):
+        executor.submit(fail_like_pytesseract, None).result(timeout=10)
+    assert executor.submit(run_subprocess, 0, None).result(timeout=10) > 0
+
+
+def test_slots_are_reused_without_reviving_old_requests():
+    table = DeadlineTable(slots=1)
+    first = table.acquire(None)
+    assert table.acquire(None) is None
+    table.release(first)
+    second = table.acquire(time.time() + 60)
+    assert second[0] == first[0]
+    assert table.expired(first) and not table.expired(second)
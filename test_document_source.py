@@ -0,0 +1,67 @@
+import base64
+import mmap
+import tempfile
+
+import pytest
+
+from utils.document_source import InlineDocument, InvalidDocumentError, LoadedDocument, is_pdf, map_file
+from utils.downloader import DocumentTooLargeError
+
+PDF = b"%PDF-1.4\n" + b"x" * 100
+
+
+def test_pdf_is_detected_by_header_not_only_name():
+    assert is_pdf(PDF, "upload")
+    assert is_pdf(b"\xef\xbb\xbf" + PDF)
+    assert is_pdf(b"\x89PNG", "bill.PDF")
+    assert not is_pdf(b"\x89PNG\r\n", "https://host/bill.png")
+
+
+def test_base64_content_and_data_urls():
+    encoded = base64.b64encode(PDF).decode()
+    assert InlineDocument(base64_content=encoded).load(10_000).buffer == PDF
+    loaded = InlineDocument(name="bill", base64_content="data:application/pdf;base64," + encoded).load(10_000)
+    assert loaded.is_pdf and loaded.path is None
+
+
+def test_malformed_base64_is_rejected_not_decoded_to_garbage():
+    with pytest.raises(InvalidDocumentError):
+        InlineDocument(base64_content="JVBERi0x!!not*base64").load(10_000)
+    wrapped = "\n".join(base64.encodebytes(PDF).decode().split())
+    assert InlineDocument(base64_content=wrapped).load(10_000).buffer == PDF
+
+
+def test_inline_documents_respect_the_size_limit():
+    with pytest.raises(DocumentTooLargeError):
+        InlineDocument(base64_content=base64.b64encode(PDF).decode()).load(50)
+    upload = tempfile.SpooledTemporaryFile()
+    upload.write(PDF)
+    with pytest.raises(DocumentTooLargeError):
+        InlineDocument(file=upload).load(50)
+
+
+def test_large_uploads_are_memory_mapped_small_ones_read():
+    small = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    small.write(PDF)
+    assert isinstance(InlineDocument(file=small).load(10_000).buffer, bytes)
+
+    large = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    large.write(PDF + b"y" * (2 * 1024 * 1024))
+    loaded = InlineDocument(file=large).load(10 * 1024 * 1024)
+    assert isinstance(loaded.buffer, mmap.mmap)
+    assert loaded.is_pdf
+    loaded.close()
+    assert loaded.buffer.closed
+
+
+def test_map_file(tmp_path):
+    path = tmp_path / "bill.pdf"
+    path.write_bytes(PDF)
+    with open(path, "rb") as f:
+        mapped = map_file(f)
+    assert mapped[:] == PDF
+    LoadedDocument(mapped).close()
+
+    (tmp_path / "empty.pdf").write_bytes(b"")
+    with open(tmp_path / "empty.pdf", "rb") as f:
+        assert map_file(f) == b""
@@ -0,0 +1,213 @@
+import asyncio
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from utils.downloader import AsyncDownloader, DocumentTooLargeError, DownloadedFile  # noqa: E402
+
+PDF_BODY = b"%PDF-1.4 " + b"x" * 200_000
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves fixed documents and records what the client did"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.peak_in_flight = max(self.server.peak_in_flight, self.server.in_flight)
+            self.server.requests.append(self.path)
+        try:
+            if self.path.startswith("/slow.pdf"):
+                time.sleep(0.2)
+            if self.path in ("/versioned.pdf", "/no-store.pdf"):
+                etag = f'"v{self.server.version}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                body = b"%PDF-1.4 version " + str(self.server.version).encode()
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", "Mon, 03 Nov 2025 10:00:00 GMT")
+                if self.path == "/no-store.pdf":
+                    self.send_header("Cache-Control", "no-store")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if self.path == "/chunked.pdf":
+                # No Content-Length, so the limit can only be enforced while streaming
+                self.send_response(200)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for _ in range(20):
+                    chunk = b"y" * 65536
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            if self.path == "/missing.pdf":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(PDF_BODY)))
+            self.end_headers()
+            self.wfile.write(PDF_BODY)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+
+@pytest.fixture
+def stand_in_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.in_flight = 0
+    server.peak_in_flight = 0
+    server.requests = []
+    server.version = 1
+    server.not_modified = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run(coro_factory):
+    async def main():
+        downloader = AsyncDownloader(per_host=2, max_bytes=500_000)
+        try:
+            return await coro_factory(downloader)
+        finally:
+            await downloader.close()
+    return asyncio.run(main())
+
+
+def test_download_streams_body(stand_in_server):
+    body = run(lambda d: d.download_bytes(f"{stand_in_server.url}/bill.pdf"))
+    assert body == PDF_BODY
+
+
+def test_connections_are_reused(stand_in_server):
+    async def sequential(downloader):
+        for _ in range(5):
+            await downloader.download_bytes(f"{stand_in_server.url}/bill.pdf")
+
+    run(sequential)
+    assert stand_in_server.connections == 1
+
+
+def test_per_host_limit(stand_in_server):
+    async def burst(downloader):
+        await asyncio.gather(*(downloader.download_bytes(f"{stand_in_server.url}/slow.pdf?copy={i}") for i in range(6)))
+
+    run(burst)
+    assert stand_in_server.peak_in_flight <= 2
+
+
+def test_oversized_content_length_fails_early(stand_in_server):
+    async def small_limit(downloader):
+        downloader.max_bytes = 1000
+        await downloader.download(f"{stand_in_server.url}/bill.pdf")
+
+    with pytest.raises(DocumentTooLargeError):
+        run(small_limit)
+
+
+def test_oversized_chunked_body_fails_while_streaming(stand_in_server):
+    with pytest.raises(DocumentTooLargeError):
+        run(lambda d: d.download(f"{stand_in_server.url}/chunked.pdf"))
+
+
+def test_http_errors_are_reported(stand_in_server):
+    with pytest.raises(Exception, match="Failed to download document"):
+        run(lambda d: d.download(f"{stand_in_server.url}/missing.pdf"))
+
+
+def test_concurrent_downloads_of_one_url_share_a_fetch(stand_in_server):
+    async def burst(downloader):
+        return await asyncio.gather(*(downloader.download_bytes(f"{stand_in_server.url}/slow.pdf") for _ in range(5)))
+
+    assert run(burst) == [PDF_BODY] * 5
+    assert stand_in_server.requests == ["/slow.pdf"]
+
+
+def test_known_urls_are_revalidated_instead_of_downloaded(stand_in_server):
+    url = f"{stand_in_server.url}/versioned.pdf"
+
+    async def three_downloads(downloader):
+        bodies = [await downloader.download_bytes(url), await downloader.download_bytes(url)]
+        stand_in_server.version = 2
+        bodies.append(await downloader.download_bytes(url))
+        return bodies
+
+    assert run(three_downloads) == [b"%PDF-1.4 version 1", b"%PDF-1.4 version 1", b"%PDF-1.4 version 2"]
+    assert stand_in_server.not_modified == 1
+    assert len(stand_in_server.requests) == 3
+
+
+def test_no_store_bodies_are_not_kept(stand_in_server):
+    url = f"{stand_in_server.url}/no-store.pdf"
+
+    async def twice(downloader):
+        await downloader.download_bytes(url)
+        return await downloader.download_bytes(url)
+
+    assert run(twice) == b"%PDF-1.4 version 1"
+    assert stand_in_server.not_modified == 0
+
+
+def test_large_bodies_go_to_disk_and_are_not_kept(stand_in_server):
+    async def large(downloader):
+        downloader.spool_bytes = 50_000
+        body = await downloader.download(f"{stand_in_server.url}/bill.pdf")
+        return body, body.path, await asyncio.to_thread(body.read), len(downloader._validated)
+
+    body, path, content, kept = run(large)
+    assert isinstance(body, DownloadedFile)
+    assert (content, body.size, kept) == (PDF_BODY, len(PDF_BODY), 0)
+    del body
+    assert not os.path.exists(path)
+
+
+def test_not_modified_survives_eviction_while_in_flight(stand_in_server):
+    url = f"{stand_in_server.url}/versioned.pdf"
+
+    async def evicted_mid_request(downloader):
+        first = await downloader.download_bytes(url)
+        session = await downloader.get_session()
+        send = session.get
+
+        def get_then_evict(*args, **kwargs):
+            request = send(*args, **kwargs)
+            downloader.forget(url)
+            return request
+
+        session.get = get_then_evict
+        second = await downloader.download_bytes(url)
+        return first, second, url in downloader._validated
+
+    first, second, kept = run(evicted_mid_request)
+    assert first == second == b"%PDF-1.4 version 1"
+    assert stand_in_server.not_modified == 1 and kept
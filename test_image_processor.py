@@ -0,0 +1,173 @@
+import os
+import shutil
+
+import pdf2image
+import pytest
+from PIL import Image
+
+from utils import image_processor
+from utils.image_processor import ImageProcessor, is_usable_text, read_pdf_page
+from utils.ocr_backend import OCRBackend
+from utils.ocr_cache import OCRCache
+
+ROW = "1 Livi 300mg Tab 14 32.00 448.00\n"
+
+
+def text_pdf(lines):
+    """Minimal one-page PDF whose lines are real text, not an image"""
+    stream = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        "/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    body = "%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{obj}\nendobj\n"
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return body.encode("latin-1")
+
+
+def test_usable_text_heuristic():
+    assert is_usable_text("MEDICOS CASH Memo\n" + ROW)
+    assert not is_usable_text("")
+    assert not is_usable_text("  \n\f 12 \n")
+    assert not is_usable_text("\ufffd" * 40 + ROW)
+    assert not is_usable_text("---- ==== |||| ---- ==== ||||")
+
+
+def test_page_with_text_layer_skips_ocr(monkeypatch):
+    monkeypatch.setattr(image_processor, "embedded_page_text", lambda path, page: "MEDICOS CASH Memo\n" + ROW)
+    monkeypatch.setattr(image_processor, "ocr_pdf_page", pytest.fail)
+    timings = {}
+    assert read_pdf_page("bill.pdf", 1, timings) == ("MEDICOS CASH Memo\n" + ROW, "embedded")
+    assert set(timings) == {"text_layer"}
+
+
+def test_page_without_text_layer_falls_back_to_ocr(monkeypatch):
+    monkeypatch.setattr(image_processor, "embedded_page_text", lambda path, page: "\f")
+    monkeypatch.setattr(image_processor, "ocr_pdf_page", lambda path, page, timings, **ocr: ROW)
+    assert read_pdf_page("bill.pdf", 2) == (ROW, "ocr")
+
+
+def test_text_layer_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(image_processor, "PDF_TEXT_LAYER", "off")
+    monkeypatch.setattr(image_processor, "embedded_page_text", pytest.fail)
+    monkeypatch.setattr(image_processor, "ocr_pdf_page", lambda path, page, timings, **ocr: ROW)
+    assert read_pdf_page("bill.pdf", 1) == (ROW, "ocr")
+
+
+def test_triage_skips_full_ocr_of_rejected_pages(monkeypatch):
+    monkeypatch.setattr(image_processor, "embedded_page_text", lambda path, page: "")
+    headers = {1: "DISCHARGE SUMMARY", 2: "MEDICOS CASH Memo"}
+    monkeypatch.setattr(image_processor, "ocr_page_header", lambda path, page, timings, **ocr: headers[page])
+    ocr_calls = []
+    monkeypatch.setattr(image_processor, "ocr_pdf_page", lambda path, page, timings, **ocr: ocr_calls.append(page) or ROW)
+
+    def should_skip(header):
+        return "SUMMARY" in header
+
+    assert read_pdf_page("bundle.pdf", 1, should_skip=should_skip) == ("DISCHARGE SUMMARY", "skipped")
+    assert read_pdf_page("bundle.pdf", 2, should_skip=should_skip) == (ROW, "ocr")
+    assert ocr_calls == [2]
+
+    monkeypatch.setattr(image_processor, "PAGE_TRIAGE", "off")
+    monkeypatch.setattr(image_processor, "ocr_page_header", pytest.fail)
+    assert read_pdf_page("bundle.pdf", 1, should_skip=should_skip) == (ROW, "ocr")
+
+
+@pytest.mark.skipif(not shutil.which("pdftotext"), reason="poppler is not installed")
+def test_digital_pdf_is_read_without_ocr(monkeypatch):
+    monkeypatch.setattr(image_processor, "ocr_pdf_page", pytest.fail)
+    pages = ImageProcessor().extract_text_from_pdf(text_pdf(["MEDICOS CASH Memo", ROW.strip()]))
+    assert pages[0]["source"] == "embedded"
+    assert "Livi 300mg Tab" in pages[0]["text"]
+
+
+def fake_pdftoppm(calls):
+    """Stand-in for pdf2image.convert_from_path: one small image per page, its width and shade set by the page number.
+
+    Written as PNGs when given an output folder, returned in memory otherwise.
+    """
+    def convert_from_path(pdf_path, dpi, first_page, last_page, output_folder=None, paths_only=False):
+        calls.append((first_page, last_page, output_folder))
+        pages = []
+        for page in range(first_page, last_page + 1):
+            image = Image.new("L", (20 + page, 20), page)
+            if output_folder is None:
+                pages.append(image)
+                continue
+            path = os.path.join(output_folder, f"page-{page:03d}.png")
+            image.save(path)
+            pages.append(path)
+        return pages
+    return convert_from_path
+
+
+class PageWidthBackend(OCRBackend):
+    """Reads the page number back from the fake page's width"""
+    name = "page-width"
+
+    def image_to_string(self, image, lang, config):
+        return f"page {image.width - 20}"
+
+
+def test_pdf_pages_are_rasterized_in_bounded_windows(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pdf2image, "convert_from_path", fake_pdftoppm(calls))
+    files_left = []
+    for page_number, image in image_processor.iter_pdf_images("bill.pdf", page_count=7, window=3):
+        assert image.getpixel((0, 0)) == page_number
+        files_left.append(len(os.listdir(calls[-1][2])))
+
+    assert [(first, last) for first, last, _ in calls] == [(1, 3), (4, 6), (7, 7)]
+    # Each window is written at once and shrinks by one file per consumed page
+    assert files_left == [3, 2, 1, 3, 2, 1, 1]
+    assert not os.path.exists(calls[0][2])
+
+
+def test_abandoned_page_stream_cleans_up(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pdf2image, "convert_from_path", fake_pdftoppm(calls))
+    pages = image_processor.iter_pdf_images("bill.pdf", page_count=10, window=4)
+    next(pages)
+    pages.close()
+    assert len(calls) == 1
+    assert not os.path.exists(calls[0][2])
+
+
+@pytest.mark.parametrize("text_layer", ["on", "off"])
+def test_parallel_pdf_pages_match_serial_mode(monkeypatch, text_layer):
+    # Pool workers fork after these patches, so they rasterize with the fake too
+    monkeypatch.setattr(pdf2image, "convert_from_path", fake_pdftoppm([]))
+    monkeypatch.setattr(image_processor, "count_pdf_pages", lambda path: 5)
+    monkeypatch.setattr(image_processor, "embedded_page_text", lambda path, page: "")
+    monkeypatch.setattr(image_processor, "PDF_TEXT_LAYER", text_layer)
+    processor = ImageProcessor(cache=OCRCache(memory_items=0), ocr_backend=PageWidthBackend())
+
+    serial_timings, parallel_timings = {}, {}
+    serial = processor.extract_text_from_pdf(b"%PDF-1.4 scan", workers=1, timings=serial_timings)
+    parallel = processor.extract_text_from_pdf(b"%PDF-1.4 scan", workers=3, timings=parallel_timings)
+    assert [page["text"] for page in serial] == [f"page {n}" for n in range(1, 6)]
+    assert parallel == serial
+    # Worker-side stage times come back to the caller
+    assert set(parallel_timings) == set(serial_timings) >= {"rasterize", "ocr"}
+
+
+def test_parallel_mode_handles_a_pdf_without_pages(monkeypatch):
+    monkeypatch.setattr(image_processor, "count_pdf_pages", lambda path: 0)
+    processor = ImageProcessor(cache=OCRCache(memory_items=0), ocr_backend=PageWidthBackend())
+    assert processor.extract_text_from_pdf(b"%PDF-1.4 empty", workers=4) == []
+
+
+def test_process_document_failure_is_an_error_not_sample_data(tmp_path):
+    with pytest.raises(Exception, match="Failed to process document"):
+        ImageProcessor().process_document(str(tmp_path / "missing.pdf"))
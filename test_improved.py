@@ -40,8 +40,8 @@ def test_improved_parsing():
                 print(f"✅ Found {len(items)} valid items:")
                 for i, item in enumerate(items, 1):
                     # Get values safely
-                    rate_value = item.get('item_rate')
-                    quantity_value = item.get('item_quantity')
+                    rate_value = item.item_rate
+                    quantity_value = item.item_quantity
                     
                     # Format rate display
                     if rate_value is not None:
@@ -55,12 +55,12 @@ def test_improved_parsing():
                     else:
                         quantity_display = " N/A"
                     
-                    print(f"   {i:2d}. {item['item_name'][:40]:40} "
-                          f"₹{item['item_amount']:8.2f} "
+                    print(f"   {i:2d}. {item.item_name[:40]:40} "
+                          f"₹{item.item_amount:8.2f} "
                           f"(Rate: {rate_display} "
                           f"Qty: {quantity_display})")
                     
-                    total_amount += item['item_amount']
+                    total_amount += item.item_amount
                 
                 total_items += len(items)
             
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.loadtest import compare, parse_config, percentile, summarize
+
+
+def test_percentiles_and_summary():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile(list(range(1, 101)), 99) == 99
+
+    records = [{"latency": 0.1 * n, "status": 200, "success": True, "error": None} for n in range(1, 9)]
+    records += [{"latency": 0.01, "status": 429, "success": False, "error": "at capacity"},
+                {"latency": 5.0, "status": 200, "success": False, "error": "bad scan"}]
+    summary = summarize(records, elapsed=4.0)
+    assert summary["throughput_rps"] == 2.0
+    assert summary["error_rate"] == 0.2
+    assert summary["errors_by_status"] == {"429": 1, "failed": 1}
+    assert summary["latency_seconds"]["p50"] == 0.4 and summary["latency_seconds"]["max"] == 0.8
+
+
+def test_configs_and_compare(capsys):
+    assert parse_config("triage-off:PAGE_TRIAGE=off,OCR_WORKERS=2") == (
+        "triage-off", {"PAGE_TRIAGE": "off", "OCR_WORKERS": "2"}
+    )
+    assert parse_config("default:") == ("default", {})
+
+    def results(rps, p95):
+        return {"runs": [{"name": "default/workers=1", "throughput_rps": rps,
+                          "latency_seconds": {"p95": p95}, "error_rate": 0.0}]}
+
+    assert compare(results(2.0, 1.0), results(1.9, 1.1), tolerance=0.2) == []
+    assert compare(results(2.0, 1.0), results(1.0, 1.0), tolerance=0.2) == ["default/workers=1 throughput_rps"]
+    assert "REGRESSION" in capsys.readouterr().out
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="resource sampling reads /proc")
+def test_load_run_end_to_end(tmp_path):
+    for module in ("aiohttp", "uvicorn", "PIL"):
+        pytest.importorskip(module)
+    output = tmp_path / "load.json"
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.loadtest", "--rate", "4", "--duration", "1.5", "--documents", "1",
+         "--pages", "1", "--items", "3", "--config", "smoke:WARM_UP=off", "--sample-interval", "0.25",
+         "--output", str(output)],
+        check=True, capture_output=True, timeout=120
+    )
+    results = json.loads(output.read_text())
+    run = results["runs"][0]
+    assert run["name"] == "smoke/workers=1"
+    assert run["settings"]["OCR_CACHE_ITEMS"] == "0"
+    assert run["requests"] > 0 and run["error_rate"] is not None
+    assert run["resources"] and run["peak_rss_mib"] > 0
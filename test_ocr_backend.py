@@ -0,0 +1,148 @@
+import os
+import sys
+import types
+
+import pdf2image
+import pytest
+from PIL import Image
+
+from utils import image_processor, ocr_backend
+from utils.image_processor import ImageProcessor, document_settings, ocr_image, ocr_settings
+from utils.ocr_cache import OCRCache
+from utils.ocr_backend import OCRBackend, PytesseractBackend, create_backend, parse_tesseract_config
+
+
+class RecordingBackend(OCRBackend):
+    name = "recording"
+
+    def __init__(self):
+        self.calls = []
+
+    def image_to_string(self, image, lang, config):
+        self.calls.append((image.size, lang, config))
+        return "1 Livi 300mg Tab 14 32.00 448.00"
+
+
+def test_parse_tesseract_config():
+    assert parse_tesseract_config("") == (None, None, {})
+    assert parse_tesseract_config("--psm 6 --oem 1 -c preserve_interword_spaces=1 --dpi 300") == (
+        6, 1, {"preserve_interword_spaces": "1", "user_defined_dpi": "300"}
+    )
+    assert parse_tesseract_config("-ctessedit_char_whitelist=0123456789.") == (
+        None, None, {"tessedit_char_whitelist": "0123456789."}
+    )
+    with pytest.raises(ValueError):
+        parse_tesseract_config("--tessdata-dir /opt/tessdata")
+
+
+def test_processor_uses_the_backend_it_is_given(tmp_path):
+    backend = RecordingBackend()
+    path = tmp_path / "receipt.png"
+    Image.new("L", (300, 200), 255).save(path)
+
+    processor = ImageProcessor(cache=OCRCache(memory_items=0), ocr_backend=backend)
+    assert processor.extract_text_from_image(path.read_bytes()) == "1 Livi 300mg Tab 14 32.00 448.00"
+    assert len(backend.calls) == 1
+
+
+def blank_pages(pdf_path, dpi, first_page, last_page, output_folder=None, paths_only=False, **options):
+    """Stand-in for pdf2image.convert_from_path: a distinct blank image per page"""
+    images = [Image.new("L", (300 + page, 200), 255) for page in range(first_page, last_page + 1)]
+    if output_folder is None:
+        return images
+    paths = []
+    for page, image in zip(range(first_page, last_page + 1), images):
+        paths.append(os.path.join(output_folder, f"page-{page}.png"))
+        image.save(paths[-1])
+    return paths
+
+
+@pytest.mark.parametrize("text_layer", ["auto", "off"])
+def test_processor_uses_its_backend_and_cache_for_pdfs(monkeypatch, text_layer):
+    monkeypatch.setattr(image_processor, "PDF_TEXT_LAYER", text_layer)
+    monkeypatch.setattr(image_processor, "count_pdf_pages", lambda path: 2)
+    monkeypatch.setattr(image_processor, "embedded_page_text", lambda path, page: "")
+    monkeypatch.setattr(pdf2image, "convert_from_path", blank_pages)
+    monkeypatch.setattr(image_processor, "get_ocr_backend", pytest.fail)
+    monkeypatch.setattr(image_processor, "get_default_cache", pytest.fail)
+    backend = RecordingBackend()
+    cache = OCRCache(memory_items=8)
+
+    processor = ImageProcessor(cache=cache, ocr_backend=backend)
+    pages = processor.extract_text_from_pdf(b"%PDF-1.4 scan", workers=1)
+    assert [page["text"] for page in pages] == ["1 Livi 300mg Tab 14 32.00 448.00"] * 2
+    assert len(backend.calls) == 2
+    assert cache.stats["misses"] == 2 and len(cache._memory) == 2
+
+
+def test_auto_falls_back_to_pytesseract_without_tesserocr(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tesserocr", None)
+    assert isinstance(create_backend("auto"), PytesseractBackend)
+    assert isinstance(create_backend("tesserocr"), PytesseractBackend)
+    with pytest.raises(ValueError):
+        create_backend("easyocr")
+
+
+def fake_tesserocr(languages):
+    """Stand-in tesserocr module whose engines only load the given languages"""
+    def engine(lang, **settings):
+        if lang not in languages:
+            raise RuntimeError(f"Failed to init API, possibly an invalid tessdata path: {lang}")
+        return object()
+
+    return types.SimpleNamespace(
+        get_languages=lambda path=None: ("/tessdata/", languages), PyTessBaseAPI=engine,
+        PSM=types.SimpleNamespace(AUTO=3), OEM=types.SimpleNamespace(DEFAULT=3)
+    )
+
+
+def test_backend_name_follows_the_fallback_to_pytesseract(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tesserocr", fake_tesserocr(["eng"]))
+    ocr_backend.configured_backend_name.cache_clear()
+    try:
+        assert ocr_backend.configured_backend_name("eng", "--psm 6") == "tesserocr"
+        assert ocr_backend.configured_backend_name("eng", "--tessdata-dir /opt") == "pytesseract"
+        assert ocr_backend.configured_backend_name("hin", "") == "pytesseract"
+        assert ocr_backend.configured_backend_name("eng", "", kind="pytesseract") == "pytesseract"
+
+        backend = ocr_backend.TesserocrBackend()
+        assert backend.engine_name("eng", "--psm 6") == "tesserocr"
+        assert backend.engine_name("hin", "") == "pytesseract"
+    finally:
+        ocr_backend.configured_backend_name.cache_clear()
+
+    monkeypatch.setitem(sys.modules, "tesserocr", None)
+    assert ocr_backend.configured_backend_name("eng", "") == "pytesseract"
+    ocr_backend.configured_backend_name.cache_clear()
+
+
+def test_tesserocr_keeps_one_engine_per_settings():
+    pytest.importorskip("tesserocr")
+    backend = ocr_backend.TesserocrBackend()
+    backend.warm_up("eng", "--psm 6")
+    assert backend.get_api("eng", "--psm 6") is backend.get_api("eng", "--psm 6")
+
+
+def test_cache_key_names_the_backend_that_ran(monkeypatch):
+    monkeypatch.setattr(ocr_backend, "_default_backend", None)
+    image = Image.new("L", (40, 20), 255)
+    cache = OCRCache(memory_items=8)
+    first, second = RecordingBackend(), RecordingBackend()
+    second.name = "other"
+
+    ocr_image(image, cache=cache, backend=first)
+    ocr_image(image, cache=cache, backend=second)
+    ocr_image(image, cache=cache, backend=first)
+    assert (len(first.calls), len(second.calls)) == (1, 1)
+    assert "backend=other" in ocr_settings("other")
+    # Naming the configured backend must not load an engine in the web process
+    document_settings()
+    assert ocr_backend._default_backend is None
+
+
+def test_backends_must_implement_image_to_string():
+    class Incomplete(OCRBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,78 @@
+import os
+
+from utils.ocr_cache import OCRCache
+
+
+def test_memory_tier_is_lru_bounded():
+    cache = OCRCache(memory_items=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"  # "a" is now most recent
+    cache.put("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert cache.stats["evictions"] == 1
+    assert cache.stats["misses"] == 1
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    key = OCRCache.make_key(OCRCache.digest(b"%PDF bill"), "1", "lang=eng")
+    OCRCache(disk_dir=str(tmp_path)).put(key, "Livi 300mg Tab 448.00")
+
+    cache = OCRCache(disk_dir=str(tmp_path))
+    assert cache.get(key) == "Livi 300mg Tab 448.00"
+    assert cache.stats["disk_hits"] == 1
+    # Promoted into memory on the first hit
+    assert cache.get(key) == "Livi 300mg Tab 448.00"
+    assert cache.stats["memory_hits"] == 1
+
+
+def test_settings_change_the_key():
+    digest = OCRCache.digest(b"bill")
+    assert OCRCache.make_key(digest, "1", "lang=eng") != OCRCache.make_key(digest, "1", "lang=hin")
+    assert OCRCache.make_key(digest, "1", "lang=eng") != OCRCache.make_key(digest, "2", "lang=eng")
+
+
+def test_disk_tier_evicts_oldest_when_over_cap(tmp_path):
+    cache = OCRCache(memory_items=0, disk_dir=str(tmp_path), disk_max_bytes=250)
+    for i in range(5):
+        key = f"{i:02d}-1-settings"
+        cache.put(key, "x" * 100)
+        path = cache._disk_path(key)
+        os.utime(path, (i, i))
+
+    assert cache.snapshot()["disk_bytes"] <= 250
+    assert cache.get("04-1-settings") == "x" * 100
+    assert cache.get("00-1-settings") is None
+
+
+def test_overwriting_an_entry_counts_its_bytes_once(tmp_path):
+    cache = OCRCache(memory_items=0, disk_dir=str(tmp_path))
+    for text in ("x" * 100, "x" * 100, "y" * 40):
+        cache.put("k", text)
+    assert cache.snapshot()["disk_bytes"] == 40
+
+
+def test_invalidate_document_drops_all_pages(tmp_path):
+    cache = OCRCache(disk_dir=str(tmp_path))
+    digest = OCRCache.digest(b"bill")
+    other = OCRCache.digest(b"other bill")
+    for page in ("1", "2", "pages"):
+        cache.put(OCRCache.make_key(digest, page, "s"), page)
+    cache.put(OCRCache.make_key(other, "1", "s"), "keep")
+
+    cache.invalidate_document(digest)
+
+    for page in ("1", "2", "pages"):
+        assert cache.get(OCRCache.make_key(digest, page, "s")) is None
+    assert cache.get(OCRCache.make_key(other, "1", "s")) == "keep"
+
+
+def test_invalidate_single_key(tmp_path):
+    cache = OCRCache(disk_dir=str(tmp_path))
+    cache.put("k", "text")
+    cache.invalidate("k")
+    assert cache.get("k") is None
+    assert cache.snapshot()["disk_bytes"] == 0
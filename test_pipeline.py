@@ -0,0 +1,189 @@
+import asyncio
+import base64
+import mmap
+import shutil
+import time
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from prometheus_client import REGISTRY  # noqa: E402
+
+from utils.document_source import InlineDocument  # noqa: E402
+from utils.downloader import DownloadedFile  # noqa: E402
+from utils.image_processor import ImageProcessor  # noqa: E402
+from utils.ocr_cache import OCRCache  # noqa: E402
+from utils.pipeline import BillPipeline  # noqa: E402
+
+PAGE_TEXT = "MEDICOS CASH Memo\n1 Livi 300mg Tab 14 32.00 448.00\n2 Metnuro 7 17.72 124.03\n"
+
+
+def stage_count(stage):
+    return REGISTRY.get_sample_value("bill_stage_seconds_count", {"stage": stage}) or 0
+
+
+def test_cached_document_reports_stage_timings(tmp_path):
+    path = tmp_path / "bill.png"
+    path.write_bytes(b"not really a png")
+    pipeline = BillPipeline(ocr_workers=1, io_workers=2)
+    pipeline.processor = ImageProcessor(cache=OCRCache())
+    digest = OCRCache.digest(path.read_bytes())
+    pipeline.processor.store_cached_pages(digest, [{"page_no": "1", "text": PAGE_TEXT}])
+    parsed_before = stage_count("parse")
+
+    timings = {}
+    try:
+        pages = asyncio.run(pipeline.process(str(path), timings))
+    finally:
+        pipeline.shutdown()
+
+    assert [item.item_amount for item in pages[0]["bill_items"]] == [448.0, 124.03]
+    assert set(timings) == {"read", "cache_lookup", "classify", "parse", "pool_wait"}
+    assert all(seconds >= 0 for seconds in timings.values())
+    assert stage_count("parse") == parsed_before + 1
+    assert pipeline._outstanding == {"cpu": 0, "io": 0}
+
+
+def test_inline_document_is_processed_without_a_file(tmp_path):
+    content = b"\x89PNG inline scan"
+    pipeline = BillPipeline(ocr_workers=1, io_workers=2)
+    pipeline.processor = ImageProcessor(cache=OCRCache())
+    pipeline.processor.store_cached_pages(OCRCache.digest(content), [{"page_no": "1", "text": PAGE_TEXT}])
+
+    document = InlineDocument(name="scan.png", base64_content=base64.b64encode(content).decode())
+    timings = {}
+    try:
+        pages = asyncio.run(pipeline.process(document, timings))
+    finally:
+        pipeline.shutdown()
+
+    assert pages[0]["text_source"] == "cache"
+    assert len(pages[0]["bill_items"]) == 2
+    assert "decode" in timings and "read" not in timings
+
+
+def test_pages_skipped_by_triage_are_reported_and_cached(tmp_path):
+    content = b"%PDF-1.4 claim bundle"
+    pipeline = BillPipeline(ocr_workers=1, io_workers=2)
+    pipeline.processor = ImageProcessor(cache=OCRCache())
+    pipeline.processor.store_cached_pages(OCRCache.digest(content), [
+        {"page_no": "1", "text": PAGE_TEXT, "source": "ocr"},
+        {"page_no": "2", "text": "DISCHARGE SUMMARY", "source": "skipped"},
+    ])
+
+    document = InlineDocument(name="bundle.pdf", base64_content=base64.b64encode(content).decode())
+    try:
+        pages = asyncio.run(pipeline.process(document, {}))
+    finally:
+        pipeline.shutdown()
+
+    assert [page["text_source"] for page in pages] == ["cache", "skipped"]
+    assert pages[1] == {"page_no": "2", "page_type": "Other", "text_source": "skipped", "bill_items": []}
+    # A cache hit triaged nothing, so it saved nothing
+    assert pipeline.build_response_data(pages, {})["skipped_pages"] == ["2"]
+    assert pipeline.build_response_data(pages, {})["triage_seconds_saved"] == 0.0
+
+
+def test_triage_saving_is_net_of_triage_time():
+    pipeline = BillPipeline(ocr_workers=1, io_workers=1)
+    pages = [
+        {"page_no": "1", "text_source": "ocr"},
+        {"page_no": "2", "text_source": "ocr"},
+        {"page_no": "3", "text_source": "skipped"},
+        {"page_no": "4", "text_source": "skipped"},
+    ]
+    timings = {"rasterize": 1.0, "preprocess": 1.0, "ocr": 4.0, "triage": 0.8}
+    assert pipeline.triage_report(pages, timings) == {"skipped_pages": ["3", "4"], "triage_seconds_saved": 5.2}
+    assert pipeline.triage_report(pages)["triage_seconds_saved"] is None
+
+
+@pytest.mark.skipif(not shutil.which("tesseract"), reason="tesseract is not installed")
+def test_warm_up_primes_every_ocr_worker():
+    pipeline = BillPipeline(ocr_workers=2, io_workers=1)
+    try:
+        assert asyncio.run(pipeline.warm_up()) >= 1
+        assert pipeline._outstanding == {"cpu": 0, "io": 0}
+    finally:
+        pipeline.shutdown()
+
+
+def test_concurrent_requests_for_a_document_share_one_job(monkeypatch):
+    from utils.deadline import DeadlineExceeded
+
+    pipeline = BillPipeline(ocr_workers=1, io_workers=1)
+    runs = []
+
+    async def fake_iter_pages(document, timings=None, deadline=None):
+        runs.append(document)
+        timings["ocr"] = 0.5
+        await asyncio.sleep(0.2)
+        yield {"page_no": "1", "page_type": "Pharmacy", "bill_items": []}
+
+    monkeypatch.setattr(pipeline, "iter_pages", fake_iter_pages)
+    url = "http://bills.example/bill.pdf"
+
+    async def burst():
+        timings = [{} for _ in range(3)]
+        impatient = pipeline.process(url, {}, deadline=time.time() + 0.05)
+        results = await asyncio.gather(
+            *(pipeline.process(url, t, deadline=time.time() + 5) for t in timings), impatient,
+            return_exceptions=True
+        )
+        return results, timings
+
+    results, timings = asyncio.run(burst())
+    assert runs == [url]
+    assert results[0] is results[1] is results[2]
+    assert isinstance(results[3], DeadlineExceeded)
+    assert timings == [{"ocr": 0.5}] * 3
+    assert not pipeline.in_flight(url)
+
+
+def test_shared_job_stops_when_every_caller_is_gone(monkeypatch):
+    pipeline = BillPipeline(ocr_workers=1, io_workers=1)
+    stopped = []
+
+    async def endless_iter_pages(document, timings=None, deadline=None):
+        try:
+            await asyncio.sleep(30)
+            yield {}
+        finally:
+            stopped.append(document)
+
+    monkeypatch.setattr(pipeline, "iter_pages", endless_iter_pages)
+
+    async def abandon():
+        callers = [asyncio.create_task(pipeline.process("bill.pdf")) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        callers[0].cancel()
+        await asyncio.sleep(0.05)
+        assert stopped == [] and pipeline.in_flight("bill.pdf")
+        callers[1].cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(abandon())
+    assert stopped == ["bill.pdf"]
+    assert not pipeline.in_flight("bill.pdf")
+
+
+def test_large_download_is_mapped_from_its_temp_file():
+    body = DownloadedFile()
+    body.write(b"%PDF-1.4 large scan")
+    body.close()
+
+    class StubDownloader:
+        async def download(self, url):
+            return body
+
+    pipeline = BillPipeline(ocr_workers=1, io_workers=2)
+    pipeline.downloader = StubDownloader()
+    try:
+        loaded = asyncio.run(pipeline.load_document("https://example.com/bill"))
+    finally:
+        pipeline.shutdown()
+
+    assert (loaded.path, loaded.owner, loaded.is_pdf) == (body.path, body, True)
+    assert isinstance(loaded.buffer, mmap.mmap) and loaded.buffer[:] == b"%PDF-1.4 large scan"
+    loaded.close()
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from benchmarks.corpus import generate_document, render_page
+from utils.preprocess import (
+    PREPROCESS_STEPS, content_box, downscale, enabled_steps, estimate_skew, otsu_threshold, preprocess
+)
+
+PAGE = render_page(generate_document(seed=5, pages=1, items=12)[0]["text"], dpi=150)
+
+
+def ink_of(image):
+    return np.asarray(image) <= otsu_threshold(image.histogram())
+
+
+def test_enabled_steps_keep_pipeline_order():
+    assert enabled_steps("crop, grayscale") == ("grayscale", "crop")
+    assert enabled_steps("none") == ()
+    assert enabled_steps(",".join(PREPROCESS_STEPS)) == PREPROCESS_STEPS
+    with pytest.raises(ValueError):
+        enabled_steps("grayscale,sharpen")
+
+
+def test_otsu_separates_ink_from_paper():
+    gray = np.full((10, 10), 220, dtype=np.uint8)
+    gray[2:4] = 30
+    threshold = otsu_threshold(Image.fromarray(gray).histogram())
+    assert 30 <= threshold < 220
+
+
+def test_downscale_caps_side_and_dpi_without_enlarging():
+    assert downscale(Image.new("L", (5000, 2500)), max_side=2500).size == (2500, 1250)
+    photo = Image.new("L", (1200, 1200))
+    photo.info["dpi"] = (600, 600)
+    assert downscale(photo, max_side=2500, target_dpi=300).size == (600, 600)
+    assert downscale(Image.new("L", (800, 600)), max_side=2500).size == (800, 600)
+
+
+@pytest.mark.parametrize("skew", [-3.0, -1.25, 2.0, 4.5])
+def test_estimate_skew_recovers_rotation(skew):
+    rotated = PAGE.rotate(skew, expand=True, fillcolor=255)
+    assert estimate_skew(ink_of(rotated)) == pytest.approx(-skew, abs=0.25)
+    assert estimate_skew(ink_of(PAGE)) == 0.0
+
+
+def test_content_box_trims_blank_margins():
+    ink = np.zeros((100, 80), dtype=bool)
+    ink[30:40, 10:60] = True
+    assert content_box(ink, margin=5) == (5, 25, 65, 45)
+    assert content_box(np.zeros((10, 10), dtype=bool)) is None
+
+
+def test_preprocess_straightens_binarizes_and_crops_a_photo():
+    photo = PAGE.rotate(2, expand=True, fillcolor=255).convert("RGB").resize((2600, 3600))
+    cleaned = preprocess(photo, PREPROCESS_STEPS)
+
+    assert cleaned.mode == "L"
+    assert set(np.unique(np.asarray(cleaned))) <= {0, 255}
+    assert max(cleaned.size) < 2500
+    assert estimate_skew(ink_of(cleaned)) == 0.0
+
+
+def test_preprocess_disabled_returns_image_untouched():
+    photo = PAGE.convert("RGB")
+    assert preprocess(photo, ()) is photo
+    assert preprocess(photo, ("grayscale",)).mode == "L"
@@ -21,7 +21,7 @@ def check_success():
         items = parser.parse_line_items(page['text'])
         all_items.extend(items)
     
-    total_amount = sum(item['item_amount'] for item in all_items)
+    total_amount = sum(item.item_amount for item in all_items)
     actual_total = 73420.25
     
     accuracy = min(total_amount, actual_total) / max(total_amount, actual_total) * 100
@@ -34,7 +34,7 @@ def check_success():
     
     print(f"\n✅ REAL MEDICAL ITEMS FOUND:")
     for i, item in enumerate(all_items[:10], 1):  # Show first 10
-        print(f"   {i}. {item['item_name']} - ₹{item['item_amount']:.2f}")
+        print(f"   {i}. {item.item_name} - ₹{item.item_amount:.2f}")
     
     print(f"\n🎯 DAY 2 GOAL: Build working OCR pipeline")
     print(f"   STATUS: ✅ COMPLETED")
@@ -0,0 +1,126 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from utils.deadline import DeadlineExceeded
+from utils.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED
+
+# Weight of the latest document in the moving average of document service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class OverloadedError(Exception):
+    """The work queue is full; `retry_after` is a hint in whole seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server is at capacity, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded admission for documents: `max_active` are processed at once and
+    up to `max_queued` more wait their turn in arrival order; the rest are
+    rejected straight away with a Retry-After estimate.
+
+    A document that would wait longer than its deadline allows is rejected
+    too, instead of queueing only to time out. Sizes come from the
+    constructor or MAX_ACTIVE_DOCUMENTS / MAX_QUEUED_DOCUMENTS.
+    """
+
+    def __init__(self, max_active: int = None, max_queued: int = None):
+        self.max_active = max_active or int(
+            os.environ.get("MAX_ACTIVE_DOCUMENTS", os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+        )
+        self.max_queued = max_queued if max_queued is not None else int(
+            os.environ.get("MAX_QUEUED_DOCUMENTS", self.max_active * 2)
+        )
+        self.active = 0
+        self._waiters = deque()
+        # Moving average of seconds per admitted document, None until one finishes
+        self.service_seconds = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def estimated_wait(self) -> float:
+        """Seconds a document arriving now would wait for a free slot"""
+        if self.active < self.max_active and not self._waiters:
+            return 0.0
+        return (self.service_seconds or 0.0) * (len(self._waiters) + 1) / self.max_active
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.estimated_wait()))
+
+    def ensure_capacity(self, deadline: float = None):
+        """Raise OverloadedError if a document arriving now would be turned away"""
+        if self.active < self.max_active and not self._waiters:
+            return
+        if len(self._waiters) >= self.max_queued:
+            raise OverloadedError(self.retry_after())
+        if deadline is not None and time.time() + self.estimated_wait() > deadline:
+            raise OverloadedError(self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self, deadline: float = None, queue_unbounded: bool = False):
+        """Hold a processing slot for the block, queueing for one if needed.
+
+        `deadline` is a time.time() value. Raises OverloadedError when the
+        queue is full or the wait would outlast the deadline, and
+        DeadlineExceeded if the deadline passes while queued. With
+        `queue_unbounded` the document always queues (batch documents,
+        whose own concurrency is bounded by the caller).
+        """
+        if not queue_unbounded:
+            self.ensure_capacity(deadline)
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+        else:
+            await self._wait_for_slot(deadline)
+        self._publish()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if self.service_seconds is None:
+                self.service_seconds = seconds
+            else:
+                self.service_seconds += SERVICE_TIME_SMOOTHING * (seconds - self.service_seconds)
+            self._release()
+
+    async def _wait_for_slot(self, deadline=None):
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait_for(waiter, None if deadline is None else max(0.0, deadline - time.time()))
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._publish()
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded("Request deadline passed while queued")
+            raise
+
+    def _release(self):
+        """Hand the slot to the longest waiting document, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+    def _publish(self):
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_QUEUED.set(len(self._waiters))
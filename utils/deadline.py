@@ -0,0 +1,131 @@
+import math
+import os
+import signal
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing.sharedctypes import RawArray
+
+# Requests that can have work in the process pool at once; more still run, just without cancellation
+DEADLINE_SLOTS = 256
+# How often a worker's watchdog checks whether its current request is over
+WATCHDOG_INTERVAL = 0.05
+
+
+class DeadlineExceeded(Exception):
+    """The request ran past its deadline or was cancelled (client gone)"""
+
+
+class DeadlineTable:
+    """Per-request deadlines in shared memory, visible to every pool worker.
+
+    The serving process claims a slot per document and hands the
+    (slot, request_id) token to its pool tasks. A request is over for the
+    workers once its wall clock deadline passes or its slot is released
+    (finished, failed or cancelled), so work already running in a worker
+    can be stopped without a round trip through the pool.
+    """
+
+    def __init__(self, slots=DEADLINE_SLOTS):
+        self.ids = RawArray("q", slots)
+        self.deadlines = RawArray("d", slots)
+        self._free = deque(range(slots))
+        self._next_id = 1
+
+    def acquire(self, deadline=None):
+        """Claim a slot for a request ending at `deadline` (time.time()), or None if all are taken"""
+        if not self._free:
+            return None
+        slot = self._free.popleft()
+        request_id = self._next_id
+        self._next_id += 1
+        self.deadlines[slot] = math.inf if deadline is None else deadline
+        self.ids[slot] = request_id
+        return slot, request_id
+
+    def release(self, token):
+        """End a request; anything of it still running in a worker gets stopped"""
+        if token is None:
+            return
+        slot, request_id = token
+        if self.ids[slot] == request_id:
+            self.ids[slot] = 0
+            self._free.append(slot)
+
+    def expired(self, token):
+        """Whether the request behind `token` is past its deadline or released"""
+        if token is None:
+            return False
+        slot, request_id = token
+        deadline = self.deadlines[slot]
+        return self.ids[slot] != request_id or time.time() > deadline
+
+
+# Worker process state: the shared table and the token of the task running now
+_table = None
+_current = None
+
+
+def init_worker_deadlines(table):
+    """Pool initializer part: watch the current task's deadline and kill its subprocesses when it passes.
+
+    The worker becomes its own process group, so tesseract and poppler
+    subprocesses it starts are in that group too. The watchdog sends the
+    group SIGUSR1: the subprocesses die (default action) and the worker's
+    handler aborts the task. In-process OCR (tesserocr) finishes its page
+    first. Without process groups (Windows) only the checks between
+    stages apply.
+    """
+    global _table
+    _table = table
+    if not hasattr(os, "killpg"):
+        return
+    os.setpgrp()
+    signal.signal(signal.SIGUSR1, _on_cancel)
+    threading.Thread(target=_watchdog, name="deadline-watchdog", daemon=True).start()
+
+
+def _watchdog():
+    while True:
+        time.sleep(WATCHDOG_INTERVAL)
+        token = _current
+        if token is not None and _table.expired(token):
+            os.killpg(os.getpgrp(), signal.SIGUSR1)
+            # One signal per task
+            while _current is token:
+                time.sleep(WATCHDOG_INTERVAL)
+
+
+def _on_cancel(signum, frame):
+    # The signal may land just after the task ended; only abort the task it was meant for
+    if _current is not None and _table.expired(_current):
+        raise DeadlineExceeded("Request deadline passed or request cancelled")
+
+
+def check_deadline(token):
+    """Raise DeadlineExceeded if the request behind `token` is already over"""
+    if _table is not None and _table.expired(token):
+        raise DeadlineExceeded("Request deadline passed or request cancelled")
+
+
+@contextmanager
+def worker_task(token):
+    """Run one pool task on behalf of the request behind `token`.
+
+    Skips work for requests that are already over, lets the watchdog stop
+    the task if its request ends meanwhile, and re-raises library errors
+    as plain Exceptions: some (pytesseract's) cannot be unpickled in the
+    serving process and would break the whole pool.
+    """
+    global _current
+    check_deadline(token)
+    _current = token
+    try:
+        yield
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise Exception(f"{type(e).__name__}: {str(e)}") from None
+    finally:
+        _current = None
@@ -0,0 +1,104 @@
+import base64
+import binascii
+import mmap
+import os
+
+from utils.downloader import DocumentTooLargeError
+
+# PDF readers accept junk before the header, so look a little way in
+PDF_MAGIC = b"%PDF-"
+PDF_MAGIC_WINDOW = 1024
+# Uploads larger than this are on disk already (Starlette spools 1 MiB in memory)
+IN_MEMORY_UPLOAD_BYTES = 1024 * 1024
+
+
+class InvalidDocumentError(Exception):
+    """Raised when an inline document cannot be decoded (the client's fault, a 400)"""
+
+
+def _b64decode_strict(content):
+    """Decode base64, rejecting anything outside the alphabet rather than skipping it.
+
+    Line-wrapped payloads are accepted: whitespace is only stripped if the
+    fast path fails, so unwrapped content is not copied first.
+    """
+    try:
+        return base64.b64decode(content, validate=True)
+    except binascii.Error:
+        return base64.b64decode("".join(content.split()), validate=True)
+
+
+def map_file(file_obj):
+    """Read-only memory map of an open file (b"" when empty, which cannot be mapped)"""
+    if os.fstat(file_obj.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def is_pdf(buffer, name=""):
+    """PDF by its header bytes, falling back to the file name"""
+    return buffer[:PDF_MAGIC_WINDOW].find(PDF_MAGIC) != -1 or name.lower().endswith(".pdf")
+
+
+def close_buffer(buffer):
+    """Release a memory map; plain bytes need nothing"""
+    if isinstance(buffer, mmap.mmap):
+        buffer.close()
+
+
+class LoadedDocument:
+    """Document bytes ready for OCR: a buffer (bytes or mmap) and its path if it is a local file.
+
+    Local files, large uploads and large downloads are memory mapped rather
+    than read, and a PDF on disk is handed to poppler by path instead of
+    being copied to a temp file. `owner` keeps a temp file such as a
+    DownloadedFile alive for as long as the document is.
+    """
+
+    def __init__(self, buffer, name="", path=None, owner=None):
+        self.buffer = buffer
+        self.name = name
+        self.path = path
+        self.owner = owner
+
+    @property
+    def is_pdf(self):
+        return is_pdf(self.buffer, self.name)
+
+    def close(self):
+        close_buffer(self.buffer)
+
+
+class InlineDocument:
+    """Document sent inside the request: base64 text (JSON) or an uploaded file (multipart)"""
+
+    def __init__(self, name="", base64_content=None, file=None):
+        self.name = name or ""
+        self.base64_content = base64_content
+        self.file = file
+
+    def __str__(self):
+        return self.name or "<inline document>"
+
+    def load(self, max_bytes):
+        """Decode or map the document (blocking), enforcing the size limit"""
+        if self.file is not None:
+            self.file.seek(0, os.SEEK_END)
+            size = self.file.tell()
+            self.file.seek(0)
+            if size > max_bytes:
+                raise DocumentTooLargeError(f"Document is {size} bytes, limit is {max_bytes}")
+            if size > IN_MEMORY_UPLOAD_BYTES:
+                return LoadedDocument(map_file(self.file), self.name)
+            return LoadedDocument(self.file.read(), self.name)
+
+        content = self.base64_content
+        if content.startswith("data:"):
+            # data:application/pdf;base64,JVBERi0...
+            content = content.partition(",")[2]
+        if len(content) * 3 // 4 > max_bytes:
+            raise DocumentTooLargeError(f"Document exceeds the {max_bytes} byte limit")
+        try:
+            return LoadedDocument(_b64decode_strict(content), self.name)
+        except binascii.Error as e:
+            raise InvalidDocumentError(f"Failed to decode base64 document: {str(e)}")
@@ -0,0 +1,184 @@
+import asyncio
+import io
+import os
+import tempfile
+import weakref
+from collections import OrderedDict
+
+from utils.metrics import REVALIDATIONS
+from utils.singleflight import SingleFlight
+
+CHUNK_SIZE = 64 * 1024
+
+
+class DocumentTooLargeError(Exception):
+    """Raised as soon as a download is known to exceed the size limit"""
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class DownloadedFile:
+    """A downloaded body too large to hold in memory, kept in a temp file.
+
+    Callers whose downloads coalesced share one instance; the file is
+    deleted once the last reference to it is gone.
+    """
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix="download-")
+        self._file = os.fdopen(fd, "wb")
+        self.size = 0
+        weakref.finalize(self, _remove_quietly, self.path)
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        """Finish writing; the file stays until the last reference is dropped"""
+        self._file.close()
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class AsyncDownloader:
+    """Asyncio document downloader sharing one pooled aiohttp session.
+
+    Connections are kept alive and reused across documents, with a global
+    and a per-host connection limit. Bodies are streamed into memory and
+    moved to a `DownloadedFile` on disk once past `spool_bytes`; the
+    download is aborted as soon as it is known to exceed `max_bytes`.
+
+    Concurrent downloads of one URL share a single fetch. In-memory bodies
+    served with an ETag or Last-Modified are kept (up to `cache_bytes` in
+    total, least recently used dropped first) and revalidated on the next
+    download: a 304 reuses the kept body instead of transferring it again.
+    """
+
+    def __init__(self, max_connections: int = None, per_host: int = None,
+                 connect_timeout: float = None, read_timeout: float = None,
+                 max_bytes: int = None, spool_bytes: int = None, cache_bytes: int = None):
+        self.max_connections = max_connections or int(os.environ.get("DOWNLOAD_MAX_CONNECTIONS", 100))
+        self.per_host = per_host or int(os.environ.get("DOWNLOAD_PER_HOST", 8))
+        self.connect_timeout = connect_timeout or float(os.environ.get("DOWNLOAD_CONNECT_TIMEOUT", 5))
+        self.read_timeout = read_timeout or float(os.environ.get("DOWNLOAD_READ_TIMEOUT", 30))
+        self.max_bytes = max_bytes or int(os.environ.get("DOWNLOAD_MAX_MB", 50)) * 1024 * 1024
+        self.spool_bytes = spool_bytes or 8 * 1024 * 1024
+        self.cache_bytes = cache_bytes if cache_bytes is not None else \
+            int(os.environ.get("DOWNLOAD_CACHE_MB", 64)) * 1024 * 1024
+        self._session = None
+        self._session_lock = asyncio.Lock()
+        self._flights = SingleFlight("download")
+        # url -> (body, etag, last_modified), least recently used first
+        self._validated = OrderedDict()
+        self._validated_bytes = 0
+
+    async def get_session(self) -> "aiohttp.ClientSession":
+        """Create the shared session on first use, inside the running loop"""
+        import aiohttp
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_host)
+                timeout = aiohttp.ClientTimeout(
+                    total=None, sock_connect=self.connect_timeout, sock_read=self.read_timeout
+                )
+                self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def download(self, url: str):
+        """A document's bytes, or a DownloadedFile if it is larger than `spool_bytes`"""
+        return await self._flights.run(url, lambda: self.fetch(url))
+
+    async def fetch(self, url: str):
+        """Fetch a document, conditionally if a validated copy is kept"""
+        session = await self.get_session()
+        kept = self._validated.get(url)
+        headers = {}
+        if kept is not None:
+            _, etag, last_modified = kept
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        body = io.BytesIO()
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304 and kept is not None:
+                    REVALIDATIONS.labels("not_modified").inc()
+                    # Another download may have evicted the entry meanwhile
+                    self.keep(url, kept)
+                    return kept[0]
+                response.raise_for_status()
+                if response.content_length is not None and response.content_length > self.max_bytes:
+                    raise DocumentTooLargeError(
+                        f"Document is {response.content_length} bytes, limit is {self.max_bytes}"
+                    )
+
+                size = 0
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise DocumentTooLargeError(f"Document exceeds the {self.max_bytes} byte limit")
+                    if size > self.spool_bytes and isinstance(body, io.BytesIO):
+                        memory, body = body, DownloadedFile()
+                        body.write(memory.getvalue())
+                    body.write(chunk)
+                if kept is not None:
+                    REVALIDATIONS.labels("modified").inc()
+            content = body if isinstance(body, DownloadedFile) else body.getvalue()
+            self.remember(url, content, response.headers)
+            return content
+        except DocumentTooLargeError:
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to download document: {str(e)}")
+        finally:
+            body.close()
+
+    def remember(self, url: str, content, headers):
+        """Keep an in-memory body for revalidation if the response allows it and it fits the cache"""
+        self.forget(url)
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not (etag or last_modified) or "no-store" in headers.get("Cache-Control", "").lower():
+            return
+        if not isinstance(content, bytes):
+            return
+        self.keep(url, (content, etag, last_modified))
+
+    def keep(self, url: str, entry):
+        """Store (body, etag, last_modified) as the most recently used entry, evicting past `cache_bytes`"""
+        self.forget(url)
+        if len(entry[0]) > self.cache_bytes:
+            return
+        self._validated[url] = entry
+        self._validated_bytes += len(entry[0])
+        while self._validated_bytes > self.cache_bytes:
+            _, (old, _, _) = self._validated.popitem(last=False)
+            self._validated_bytes -= len(old)
+
+    def forget(self, url: str):
+        """Drop the kept copy of a URL, so its next download is unconditional"""
+        kept = self._validated.pop(url, None)
+        if kept is not None:
+            self._validated_bytes -= len(kept[0])
+
+    async def download_bytes(self, url: str) -> bytes:
+        """Download a document fully into memory"""
+        body = await self.download(url)
+        if isinstance(body, DownloadedFile):
+            return await asyncio.to_thread(body.read)
+        return body
+
+    async def close(self):
+        """Close the pooled session and its connections"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
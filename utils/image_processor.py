@@ -1,16 +1,252 @@
-import requests
-import pytesseract
-from PIL import Image
 import io
-import pdf2image
 import os
 import base64
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from utils.document_source import close_buffer, is_pdf, map_file
+from utils.metrics import timed
+from utils.ocr_backend import configured_backend_name, get_ocr_backend
+from utils.ocr_cache import OCRCache, get_default_cache
+
+# OCR settings are part of every cache key, so changing them never serves stale text
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+OCR_CONFIG = os.environ.get("OCR_CONFIG", "")
+PDF_DPI = int(os.environ.get("PDF_DPI", 200))
+# Pages rasterized per pdftoppm call when OCR'ing a PDF page by page. Pages
+# go to a temp folder and only the one being OCR'd is decoded in memory, so
+# this bounds temp disk use, not memory
+PDF_RASTER_WINDOW = int(os.environ.get("PDF_RASTER_WINDOW", 4))
+# "auto" reads a PDF page's embedded text layer and only OCRs pages without
+# usable text; "off" always rasterizes and OCRs
+PDF_TEXT_LAYER = os.environ.get("PDF_TEXT_LAYER", "auto")
+# Fewer visible characters than this and the text layer is treated as missing
+MIN_TEXT_LAYER_CHARS = 20
+# "on" OCRs the header band of a scanned PDF page at low resolution first and
+# skips full OCR of pages the caller's classifier rejects; "off" OCRs every page
+PAGE_TRIAGE = os.environ.get("PAGE_TRIAGE", "on")
+PAGE_TRIAGE_DPI = int(os.environ.get("PAGE_TRIAGE_DPI", 100))
+# Top fraction of the page read by the triage pass (titles and letterheads)
+PAGE_TRIAGE_BAND = float(os.environ.get("PAGE_TRIAGE_BAND", 0.3))
+
+# PIL, numpy, pdf2image, pytesseract and requests are imported where they are
+# used, so importing this module (and the app) stays fast; see import_ocr_modules
+
+def import_ocr_modules():
+    """Import the OCR stack now instead of on the first page.
+
+    Warm-up calls this before the worker pool forks, and gunicorn --preload
+    before its workers fork, so the modules are loaded once and shared.
+    """
+    import numpy  # noqa: F401
+    import pdf2image  # noqa: F401
+    import pytesseract  # noqa: F401
+    from PIL import Image  # noqa: F401
+    import utils.preprocess  # noqa: F401
+
+def configure_tesseract():
+    """Point pytesseract at the tesseract binary for this platform"""
+    # Set tesseract path for Windows
+    if os.name == 'nt':  # Windows
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+def write_temp_pdf(pdf_content):
+    """Spill PDF bytes to a temp file so page workers can open it by path"""
+    fd, pdf_path = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf_content)
+    return pdf_path
+
+@contextmanager
+def pdf_on_disk(pdf_content, pdf_path=None):
+    """Path to the PDF: `pdf_path` as is, or a temp copy of `pdf_content` removed afterwards"""
+    if pdf_path is not None:
+        yield pdf_path
+        return
+    pdf_path = write_temp_pdf(pdf_content)
+    try:
+        yield pdf_path
+    finally:
+        os.remove(pdf_path)
+
+def open_image(image_content):
+    """PIL image from a path, a file-like buffer (mmap) or bytes, without copying the bytes"""
+    from PIL import Image
+    if isinstance(image_content, str):
+        return Image.open(image_content)
+    if hasattr(image_content, "seek"):
+        image_content.seek(0)
+        return Image.open(image_content)
+    # BytesIO shares an immutable bytes object instead of copying it
+    return Image.open(io.BytesIO(image_content))
+
+def count_pdf_pages(pdf_path):
+    """Number of pages in a PDF on disk"""
+    import pdf2image
+    return int(pdf2image.pdfinfo_from_path(pdf_path)["Pages"])
+
+def ocr_settings(backend_name=None):
+    """String form of the OCR settings, mixed into cache keys.
+
+    `backend_name` is the backend that actually runs the OCR; without it
+    the configured one is named, so the web process never loads an engine.
+    """
+    from utils.preprocess import preprocess_settings
+    backend_name = backend_name or configured_backend_name(OCR_LANG, OCR_CONFIG)
+    return f"lang={OCR_LANG};config={OCR_CONFIG};dpi={PDF_DPI};{preprocess_settings()};backend={backend_name}"
+
+def document_settings():
+    """Settings that decide a document's page texts, mixed into document cache keys"""
+    triage = f"{PAGE_TRIAGE}@{PAGE_TRIAGE_DPI}x{PAGE_TRIAGE_BAND}" if PAGE_TRIAGE != "off" else "off"
+    return f"{ocr_settings()};text_layer={PDF_TEXT_LAYER};triage={triage}"
+
+def init_ocr_worker():
+    """Process pool initializer: load the OCR engine before the first page arrives"""
+    configure_tesseract()
+    try:
+        get_ocr_backend().warm_up(OCR_LANG, OCR_CONFIG)
+    except Exception as e:
+        # A failing initializer breaks the whole pool, so only log it
+        print(f"Failed to warm up OCR backend: {str(e)}")
+
+def ocr_image(image, cache=None, timings=None, backend=None):
+    """OCR a PIL image, reusing cached text when the same page pixels were seen before"""
+    from utils.preprocess import preprocess
+    timings = {} if timings is None else timings
+    backend = backend or get_ocr_backend()
+    key = None
+    if cache is not None:
+        # Keyed on the rendered page itself, so a page is reused even when
+        # the PDF around it changes
+        pixels = image.tobytes()
+        key = OCRCache.make_key(OCRCache.digest(pixels), f"{image.mode}{image.size}", ocr_settings(backend.engine_name(OCR_LANG, OCR_CONFIG)))
+        text = cache.get(key)
+        if text is not None:
+            return text
+    with timed(timings, "preprocess"):
+        image = preprocess(image)
+    with timed(timings, "ocr"):
+        text = backend.image_to_string(image, OCR_LANG, OCR_CONFIG)
+    if key is not None:
+        cache.put(key, text)
+    return text
+
+def iter_pdf_images(pdf_path, page_count=None, window=None, timings=None):
+    """Yield (page_number, PIL image), rasterizing `window` pages at a time.
+
+    Each image is closed and its file deleted as soon as the consumer asks
+    for the next page, so memory holds one decoded page whatever the
+    document length.
+    """
+    import pdf2image
+    from PIL import Image
+    window = window or PDF_RASTER_WINDOW
+    page_count = page_count or count_pdf_pages(pdf_path)
+    timings = {} if timings is None else timings
+    with tempfile.TemporaryDirectory(prefix="bill-pages-") as folder:
+        for first_page in range(1, page_count + 1, window):
+            last_page = min(first_page + window - 1, page_count)
+            with timed(timings, "rasterize"):
+                paths = pdf2image.convert_from_path(
+                    pdf_path, dpi=PDF_DPI, first_page=first_page, last_page=last_page,
+                    output_folder=folder, paths_only=True
+                )
+            if len(paths) != last_page - first_page + 1:
+                raise Exception(f"Expected pages {first_page}-{last_page}, pdftoppm wrote {len(paths)}")
+            for page_number, path in zip(range(first_page, last_page + 1), paths):
+                try:
+                    with Image.open(path) as image:
+                        yield page_number, image
+                finally:
+                    os.remove(path)
+
+def embedded_page_text(pdf_path, page_number):
+    """Text layer of one PDF page via poppler's pdftotext, or "" when it has none"""
+    try:
+        result = subprocess.run(
+            ["pdftotext", "-layout", "-enc", "UTF-8", "-f", str(page_number), "-l", str(page_number), pdf_path, "-"],
+            capture_output=True, timeout=30, check=True
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Could not read text layer of page {page_number}: {str(e)}")
+        return ""
+    return result.stdout.decode("utf-8", errors="replace")
+
+def is_usable_text(text):
+    """Whether an embedded text layer looks like real text rather than empty or garbled glyphs"""
+    visible = [c for c in text if not c.isspace()]
+    if len(visible) < MIN_TEXT_LAYER_CHARS:
+        return False
+    # Fonts without a unicode map come out as U+FFFD, private-use or control characters
+    garbled = sum(1 for c in visible if c == "\ufffd" or not c.isprintable() or "\ue000" <= c <= "\uf8ff")
+    alnum = sum(1 for c in visible if c.isalnum())
+    return garbled <= len(visible) * 0.05 and alnum >= len(visible) * 0.5
+
+def ocr_page_header(pdf_path, page_number, timings=None, backend=None):
+    """OCR the top band of one PDF page rendered at PAGE_TRIAGE_DPI, for cheap page triage"""
+    import pdf2image
+    configure_tesseract()
+    timings = {} if timings is None else timings
+    backend = backend or get_ocr_backend()
+    with timed(timings, "triage"):
+        images = pdf2image.convert_from_path(
+            pdf_path, dpi=PAGE_TRIAGE_DPI, first_page=page_number, last_page=page_number, grayscale=True
+        )
+        page = images[0]
+        band = page.crop((0, 0, page.width, max(1, int(page.height * PAGE_TRIAGE_BAND))))
+        return backend.image_to_string(band, OCR_LANG, OCR_CONFIG)
+
+def read_pdf_page(pdf_path, page_number, timings=None, should_skip=None, backend=None, cache=None):
+    """Text of one PDF page and where it came from: ("embedded" | "ocr" | "skipped").
+
+    With `should_skip`, a page without a text layer is triaged before full
+    OCR: its header band is OCR'd at low resolution and, if
+    `should_skip(header_text)` is true, the header text is returned as a
+    "skipped" page without rendering the page at PDF_DPI. `backend` and
+    `cache` default to the process-wide ones.
+    """
+    timings = {} if timings is None else timings
+    if PDF_TEXT_LAYER != "off":
+        with timed(timings, "text_layer"):
+            text = embedded_page_text(pdf_path, page_number)
+        if is_usable_text(text):
+            return text, "embedded"
+    if should_skip is not None and PAGE_TRIAGE != "off":
+        header = ocr_page_header(pdf_path, page_number, timings, backend=backend)
+        if should_skip(header):
+            return header, "skipped"
+    return ocr_pdf_page(pdf_path, page_number, timings, backend=backend, cache=cache), "ocr"
+
+def read_pdf_page_timed(pdf_path, page_number, backend=None, cache=None):
+    """Process pool entry point: read_pdf_page plus its stage timings, as ((text, source), timings)"""
+    timings = {}
+    return read_pdf_page(pdf_path, page_number, timings, backend=backend, cache=cache), timings
+
+def ocr_pdf_page(pdf_path, page_number, timings=None, backend=None, cache=None):
+    """Rasterize and OCR one PDF page (process pool entry point)"""
+    import pdf2image
+    configure_tesseract()
+    timings = {} if timings is None else timings
+    with timed(timings, "rasterize"):
+        images = pdf2image.convert_from_path(pdf_path, dpi=PDF_DPI, first_page=page_number, last_page=page_number)
+    return ocr_image(images[0], cache or get_default_cache(), timings, backend)
 
 class ImageProcessor:
-    def __init__(self):
-        # Set tesseract path for Windows
-        if os.name == 'nt':  # Windows
-            pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+    def __init__(self, pdf_workers=None, cache=None, ocr_backend=None):
+        configure_tesseract()
+        # Worker processes used to OCR PDF pages in parallel (1 = sequential)
+        self.pdf_workers = pdf_workers or int(os.environ.get("PDF_WORKERS", 1))
+        self.cache = cache or get_default_cache()
+        # Any OCRBackend (utils/ocr_backend.py); defaults to OCR_BACKEND, created on first use
+        self._ocr_backend = ocr_backend
+    
+    @property
+    def ocr_backend(self):
+        return self._ocr_backend or get_ocr_backend()
     
     def is_url(self, document_path):
         """Check if the document is a URL or local file"""
@@ -19,6 +255,7 @@ class ImageProcessor:
     def download_document(self, url):
         """Download document from URL"""
         try:
+            import requests
             response = requests.get(url, timeout=30)
             response.raise_for_status()
             return response.content
@@ -33,67 +270,150 @@ class ImageProcessor:
         except Exception as e:
             raise Exception(f"Failed to read local file: {str(e)}")
     
-    def extract_text_from_image(self, image_content):
-        """Extract text from image content"""
+    def map_local_file(self, file_path):
+        """Memory map a local file read-only instead of copying it into memory"""
+        try:
+            with open(file_path, 'rb') as f:
+                return map_file(f)
+        except Exception as e:
+            raise Exception(f"Failed to read local file: {str(e)}")
+    
+    def extract_text_from_image(self, image_content, timings=None):
+        """Extract text from image bytes, a memory map or a path, adding stage times to `timings` if given"""
         try:
-            image = Image.open(io.BytesIO(image_content))
-            text = pytesseract.image_to_string(image)
+            image = open_image(image_content)
+            text = ocr_image(image, self.cache, timings, self.ocr_backend)
             return text
         except Exception as e:
             raise Exception(f"Failed to extract text from image: {str(e)}")
     
-    def extract_text_from_pdf(self, pdf_content):
-        """Extract text from PDF content"""
+    def extract_text_from_pdf(self, pdf_content, workers=None, timings=None, pdf_path=None):
+        """Extract text from PDF content, adding stage times to `timings` if given.
+
+        Pass `pdf_path` when the PDF is already on disk to skip the temp copy.
+        Each page reports its "source": "embedded" when its text layer was
+        used, "ocr" when it was rasterized and OCR'd.
+        """
+        workers = workers or self.pdf_workers
+        if workers > 1:
+            return self.extract_text_from_pdf_parallel(pdf_content, workers, pdf_path, timings)
+        return list(self.iter_text_from_pdf(pdf_content, timings, pdf_path))
+    
+    def iter_text_from_pdf(self, pdf_content, timings=None, pdf_path=None):
+        """Yield each page's text as soon as it is read, holding at most one page image"""
+        timings = {} if timings is None else timings
         try:
-            # Convert PDF to images
-            images = pdf2image.convert_from_bytes(pdf_content)
-            
-            pages_text = []
-            for i, image in enumerate(images):
-                text = pytesseract.image_to_string(image)
-                pages_text.append({
-                    "page_no": str(i + 1),
-                    "text": text
-                })
-            
-            return pages_text
+            with pdf_on_disk(pdf_content, pdf_path) as pdf_path:
+                page_count = count_pdf_pages(pdf_path)
+                if PDF_TEXT_LAYER != "off":
+                    # Text layer first, so only pages without one get rasterized
+                    for page_number in range(1, page_count + 1):
+                        text, source = read_pdf_page(
+                            pdf_path, page_number, timings, backend=self.ocr_backend, cache=self.cache
+                        )
+                        yield {"page_no": str(page_number), "text": text, "source": source}
+                    return
+                
+                for page_number, image in iter_pdf_images(pdf_path, page_count, timings=timings):
+                    text = ocr_image(image, self.cache, timings, self.ocr_backend)
+                    yield {"page_no": str(page_number), "text": text, "source": "ocr"}
         except Exception as e:
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
     
-    def process_document(self, document_path):
-        """Main method to process any document - URL or local file"""
+    def extract_text_from_pdf_parallel(self, pdf_content, workers, pdf_path=None, timings=None):
+        """Rasterize and OCR PDF pages concurrently across worker processes, adding their stage times to `timings`"""
+        timings = {} if timings is None else timings
         try:
-            if self.is_url(document_path):
-                print(f"Downloading from URL: {document_path}")
-                content = self.download_document(document_path)
-            else:
-                print(f"Reading local file: {document_path}")
-                content = self.read_local_file(document_path)
-            
-            # Check file type and process accordingly
-            if document_path.lower().endswith('.pdf'):
-                return self.extract_text_from_pdf(content)
-            else:
-                # Assume it's an image
-                text = self.extract_text_from_image(content)
-                return [{"page_no": "1", "text": text}]
-                
+            with pdf_on_disk(pdf_content, pdf_path) as pdf_path:
+                page_count = count_pdf_pages(pdf_path)
+                if page_count == 0:
+                    return []
+                page_numbers = range(1, page_count + 1)
+                with ProcessPoolExecutor(max_workers=min(workers, page_count), initializer=init_ocr_worker) as pool:
+                    # Workers get a copy of the cache (same disk tier) and of an injected
+                    # backend; without one each worker uses its own OCR_BACKEND engine
+                    read_page = partial(read_pdf_page_timed, backend=self._ocr_backend, cache=self.cache)
+                    # map() yields results in submission order, so page_no stays sorted
+                    pages = []
+                    for page_number, ((text, source), page_timings) in zip(
+                        page_numbers, pool.map(read_page, [pdf_path] * page_count, page_numbers)
+                    ):
+                        for name, seconds in page_timings.items():
+                            timings[name] = timings.get(name, 0.0) + seconds
+                        pages.append({"page_no": str(page_number), "text": text, "source": source})
+                    return pages
         except Exception as e:
-            print(f"Error in process_document: {str(e)}")
-            # Return some sample data for testing
-            return [{"page_no": "1", "text": self.get_sample_bill_text()}]
+            raise Exception(f"Failed to extract text from PDF: {str(e)}")
+    
+    def load_document(self, document_path):
+        """Fetch raw document bytes from a URL or local file (I/O bound)"""
+        if self.is_url(document_path):
+            print(f"Downloading from URL: {document_path}")
+            return self.download_document(document_path)
+        print(f"Reading local file: {document_path}")
+        return self.map_local_file(document_path)
     
-    def get_sample_bill_text(self):
-        """Return sample bill text for testing when real processing fails"""
-        return """
-        MEDICOS CASH Memo
+    def extract_text(self, document_path, content):
+        """Run OCR on already loaded document content (CPU bound)"""
+        digest = self.cache.digest(content)
+        cached = self.get_cached_pages(digest)
+        if cached is not None:
+            return cached
+        
+        # Check file type and process accordingly
+        if is_pdf(content, document_path):
+            # A local PDF is read in place rather than copied to a temp file
+            pdf_path = None if self.is_url(document_path) else document_path
+            pages = self.extract_text_from_pdf(content, pdf_path=pdf_path)
+        else:
+            # Assume it's an image
+            text = self.extract_text_from_image(content)
+            pages = [{"page_no": "1", "text": text, "source": "ocr"}]
         
-        S/N Description QTY RATE AMOUNT
-        1 Livi 300mg Tab 14 32.00 448.00
-        2 Metnuro 7 17.72 124.03
-        3 Pizat 4.5 2 419.06 838.12
-        4 Supralite Os Syp 1 289.69 289.69
+        self.store_cached_pages(digest, pages)
+        return pages
+    
+    def get_cached_pages(self, digest):
+        """Return every page of a previously OCR'd document, or None.
+
+        Pages triage skipped come back with source "skipped" (their text is
+        only the header band); every other page has source "cache".
+        """
+        settings = document_settings()
+        page_count = self.cache.get(OCRCache.make_key(digest, "pages", settings))
+        if page_count is None:
+            return None
+        skipped = self.cache.get(OCRCache.make_key(digest, "skipped", settings)) or ""
+        skipped = set(skipped.split(","))
         
-        Sub Total: 1699.84
-        Final Total: 1699.84
-        """
\ No newline at end of file
+        pages = []
+        for page_index in range(1, int(page_count) + 1):
+            text = self.cache.get(OCRCache.make_key(digest, str(page_index), settings))
+            if text is None:
+                return None
+            source = "skipped" if str(page_index) in skipped else "cache"
+            pages.append({"page_no": str(page_index), "text": text, "source": source})
+        return pages
+    
+    def store_cached_pages(self, digest, pages):
+        """Cache each page's text under the document digest and page index"""
+        settings = document_settings()
+        for page in pages:
+            self.cache.put(OCRCache.make_key(digest, page["page_no"], settings), page["text"])
+        skipped = [page["page_no"] for page in pages if page.get("source") == "skipped"]
+        self.cache.put(OCRCache.make_key(digest, "skipped", settings), ",".join(skipped))
+        # Written last so a reader never sees a manifest without its pages
+        self.cache.put(OCRCache.make_key(digest, "pages", settings), str(len(pages)))
+    
+    def process_document(self, document_path):
+        """Main method to process any document - URL or local file"""
+        try:
+            content = self.load_document(document_path)
+            try:
+                return self.extract_text(document_path, content)
+            finally:
+                close_buffer(content)
+                
+        except Exception as e:
+            # Never substitute made-up text: callers must see the failure
+            raise Exception(f"Failed to process document {document_path}: {str(e)}")
@@ -0,0 +1,152 @@
+import json
+import os
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+# Keyword classes TextParser looks for; every keyword is matched as a
+# lowercase substring, exactly like the `pattern in lower_line` checks
+# these lists replaced.
+DEFAULT_KEYWORDS = {
+    # Lines that are headers, totals or other non-item text
+    "header": [
+        'total', 'subtotal', 'grand total', 'net amount', 'final bill',
+        'bill no', 'patient name', 'page', 'date', 's.no', 'particulars',
+        'rate', 'qty', 'amount', 'hospita', 'consult', 'address',
+        'description', 'hsn', 'batch', 'exp', 'gst', 'tax', 'discount'
+    ],
+    # Words that make an item name look like a medicine
+    "medicine": [
+        'tab', 'cap', 'inj', 'syr', 'syp', 'cream', 'ointment', 'gel',
+        'mg', 'gm', 'ml', 'iv', 'oral', 'topical', 'injection'
+    ],
+    # Item names that are never real line items
+    "non_item": ['total', 'subtotal', 'date', 'page', 'bill', 'no.'],
+    # Page type markers, checked in this order by detect_page_type
+    "pharmacy_page": ['pharmacy', 'medicos', 'drug', 'cash memo', 'medicine'],
+    "final_bill_page": ['final bill', 'grand total', 'net amount payable'],
+    # Headers of claim bundle pages that are not bills, skipped by page triage
+    "other_page": [
+        'discharge summary', 'lab report', 'laboratory report', 'test report',
+        'pathology report', 'radiology report', 'investigation report',
+        'prescription', 'case sheet', 'consent form', 'clinical notes',
+        'progress notes', 'aadhaar', 'identity card', 'date of birth',
+        'government of india', 'income tax department', 'policy schedule'
+    ],
+    # Header words that keep a page billable even if it also matches other_page
+    "bill_page": ['bill', 'invoice', 'receipt', 'cash memo', 'charges', 'amount', 'payment', 'total'],
+}
+
+
+def load_keywords(path: str) -> Dict[str, list]:
+    """Read keyword classes from a JSON file, on top of the defaults"""
+    with open(path, 'r', encoding='utf-8') as f:
+        overrides = json.load(f)
+    keywords = dict(DEFAULT_KEYWORDS)
+    keywords.update(overrides)
+    return keywords
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Prefix-factored alternation, so each position is tried against a
+    trie instead of every keyword in turn"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        ends_here = '' in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if ends_here:
+            # A longer keyword is optional past a shorter one
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+_default_matcher = None
+
+
+def get_default_matcher() -> 'KeywordMatcher':
+    """Shared matcher for DEFAULT_KEYWORDS, or the PARSER_KEYWORDS_FILE JSON if set"""
+    global _default_matcher
+    if _default_matcher is None:
+        path = os.environ.get("PARSER_KEYWORDS_FILE")
+        _default_matcher = KeywordMatcher(load_keywords(path) if path else DEFAULT_KEYWORDS)
+    return _default_matcher
+
+
+class KeywordMatcher:
+    """Finds every keyword class present in a text with one compiled scan.
+
+    The keywords are compiled into a single trie-shaped regex inside a
+    lookahead, so finditer reports a (longest) keyword at every offset,
+    including overlapping ones. Each keyword maps to its own classes plus
+    those of every shorter keyword that is a prefix of it, which makes one
+    scan equivalent to testing every keyword with `in`.
+    """
+
+    def __init__(self, keywords: Dict[str, Iterable[str]] = None):
+        self.keywords = {name: [w.lower() for w in words if w]
+                         for name, words in (keywords or DEFAULT_KEYWORDS).items()}
+
+        word_classes = {}
+        for name, words in self.keywords.items():
+            for word in words:
+                word_classes.setdefault(word, set()).add(name)
+
+        self._classes = {}
+        for word in word_classes:
+            classes = set()
+            for other, other_classes in word_classes.items():
+                if word.startswith(other):
+                    classes |= other_classes
+            self._classes[word] = frozenset(classes)
+
+        self._pattern = None
+        if word_classes:
+            # The leading character class lets the scanner skip most offsets cheaply
+            first_chars = ''.join(sorted({word[0] for word in word_classes}))
+            self._pattern = re.compile(
+                '(?=[' + re.escape(first_chars) + '])(?=(' + _trie_pattern(word_classes) + '))'
+            )
+        self._last = (None, frozenset())
+
+    def classes(self, text: str) -> FrozenSet[str]:
+        """Names of all keyword classes with a keyword in text (case-insensitive)"""
+        # parse_line_items checks the same item name for several classes in a row
+        last_text, last_classes = self._last
+        if text == last_text:
+            return last_classes
+        found = set()
+        if self._pattern is not None:
+            for match in self._pattern.finditer(text.lower()):
+                found |= self._classes[match.group(1)]
+        classes = frozenset(found)
+        self._last = (text, classes)
+        return classes
+
+    def offsets(self, text: str, name: str) -> Optional[List[int]]:
+        """Ascending offsets in text where a keyword of the named class starts.
+
+        One scan for a whole page instead of `matches` per line. None when
+        lowercasing changes the text's length (a few non-ASCII letters), as
+        offsets into the lowered text would not line up with `text`.
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            return None
+        if self._pattern is None:
+            return []
+        return [match.start() for match in self._pattern.finditer(lowered)
+                if name in self._classes[match.group(1)]]
+
+    def matches(self, text: str, name: str) -> bool:
+        """True if text contains any keyword from the named class"""
+        return name in self.classes(text)
@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(slots=True)
+class LineItem:
+    """One bill line item, from the parser all the way into the JSON response.
+
+    Slotted, so a bill with thousands of items carries no per-item dict,
+    and orjson encodes it natively with the same keys as the BillItem model.
+    """
+    item_name: str
+    item_amount: float
+    item_rate: Optional[float] = None
+    item_quantity: Optional[float] = None
+
+    def __reduce__(self):
+        # Pickled across the process pool as a class reference and a field tuple
+        return LineItem, (self.item_name, self.item_amount, self.item_rate, self.item_quantity)
@@ -0,0 +1,83 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Wide enough for a cache lookup (ms) and a long scanned PDF (a minute)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "bill_stage_seconds", "Time spent in one pipeline stage (per page for OCR stages)",
+    ["stage"], buckets=BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "bill_request_seconds", "End to end time to process one document", ["endpoint"], buckets=BUCKETS
+)
+REQUESTS = Counter("bill_requests_total", "Documents processed", ["endpoint", "outcome"])
+PAGES = Counter("bill_pages_total", "Pages parsed, by where their text came from", ["source"])
+IN_FLIGHT = Gauge("bill_requests_in_flight", "Documents currently being processed", multiprocess_mode="livesum")
+POOL_TASKS = Gauge("bill_pool_tasks", "Tasks submitted to a worker pool and not finished yet", ["pool"], multiprocess_mode="livesum")
+POOL_QUEUE_DEPTH = Gauge("bill_pool_queue_depth", "Tasks waiting for a free pool worker", ["pool"], multiprocess_mode="livesum")
+ADMISSION_ACTIVE = Gauge("bill_admission_active", "Documents holding a processing slot", multiprocess_mode="livesum")
+ADMISSION_QUEUED = Gauge("bill_admission_queued", "Documents waiting for a processing slot", multiprocess_mode="livesum")
+COALESCED = Counter(
+    "bill_coalesced_total", "Calls that joined an identical download or document job already in flight", ["kind"]
+)
+REVALIDATIONS = Counter(
+    "bill_download_revalidations_total", "Conditional downloads of a known URL, by whether it had changed", ["result"]
+)
+
+
+@contextmanager
+def timed(timings, name):
+    """Add the wall time of the block to timings[name] (safe inside pool workers)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def stage(name, timings=None):
+    """Time a stage in the serving process: observe it and add it to a request's breakdown"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe({name: time.perf_counter() - start}, timings)
+
+
+def observe(stage_timings, timings=None):
+    """Publish stage timings (e.g. returned by a pool worker) and merge them into timings"""
+    for name, seconds in stage_timings.items():
+        STAGE_SECONDS.labels(name).observe(seconds)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + seconds
+
+
+def mean_stage_seconds(names):
+    """Summed average seconds of the given stages over this process's lifetime, or None if one never ran"""
+    total = 0.0
+    for name in names:
+        count = REGISTRY.get_sample_value("bill_stage_seconds_count", {"stage": name})
+        if not count:
+            return None
+        total += REGISTRY.get_sample_value("bill_stage_seconds_sum", {"stage": name}) / count
+    return total
+
+
+def latest():
+    """Current metrics in the Prometheus text format, with its content type.
+
+    Under gunicorn (PROMETHEUS_MULTIPROC_DIR set) every worker writes its
+    metrics to that folder and they are summed across workers here.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,172 @@
+import os
+import shlex
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+# "auto" uses tesserocr when it is installed and falls back to pytesseract
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto")
+
+
+class OCRBackend(ABC):
+    """Turns a PIL image into text. ImageProcessor takes any subclass."""
+    name = "base"
+
+    @abstractmethod
+    def image_to_string(self, image, lang, config):
+        """Text of `image` for tesseract's `lang` and CLI `config`"""
+
+    def engine_name(self, lang, config):
+        """Name of the engine that runs for these settings, mixed into cache keys"""
+        return self.name
+
+    def warm_up(self, lang, config):
+        """Load whatever the first image_to_string call would otherwise load"""
+
+
+class PytesseractBackend(OCRBackend):
+    """Runs the tesseract CLI per image: a new process, temp files and a model load every call"""
+    name = "pytesseract"
+
+    def image_to_string(self, image, lang, config):
+        import pytesseract
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+
+def parse_tesseract_config(config):
+    """Split a tesseract CLI config string into (psm, oem, variables) for tesserocr"""
+    tokens = shlex.split(config or "")
+    psm = oem = None
+    variables = {}
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        value = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token in ("--psm", "--oem", "--dpi") and value is not None:
+            if token == "--psm":
+                psm = int(value)
+            elif token == "--oem":
+                oem = int(value)
+            else:
+                variables["user_defined_dpi"] = value
+            i += 2
+        elif token == "-c" and value is not None and "=" in value:
+            name, _, setting = value.partition("=")
+            variables[name] = setting
+            i += 2
+        elif token.startswith("-c") and "=" in token:
+            name, _, setting = token[2:].partition("=")
+            variables[name] = setting
+            i += 1
+        else:
+            raise ValueError(f"Unsupported tesseract option for tesserocr: {token}")
+    return psm, oem, variables
+
+
+class TesserocrBackend(OCRBackend):
+    """Keeps a tesseract engine alive in the process and hands it images in memory.
+
+    The language model is loaded once per (lang, config) and thread, and
+    images go straight from PIL to the engine without temp files.
+    """
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+        self.tesserocr = tesserocr
+        self.fallback = PytesseractBackend()
+        # (lang, config) pairs tesserocr cannot run, handed to pytesseract instead
+        self.unsupported = set()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Engines belong to their process and thread; a pickled copy loads its own
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def get_api(self, lang, config):
+        """The engine for this thread and settings, created on first use"""
+        apis = self._local.__dict__.setdefault("apis", {})
+        key = (lang, config)
+        if key not in apis:
+            psm, oem, variables = parse_tesseract_config(config)
+            apis[key] = self.tesserocr.PyTessBaseAPI(
+                lang=lang,
+                psm=self.tesserocr.PSM.AUTO if psm is None else psm,
+                oem=self.tesserocr.OEM.DEFAULT if oem is None else oem,
+                variables=variables,
+            )
+        return apis[key]
+
+    def usable_api(self, lang, config):
+        """The engine for these settings, or None when tesserocr cannot run them"""
+        if (lang, config) in self.unsupported:
+            return None
+        try:
+            return self.get_api(lang, config)
+        except (ValueError, RuntimeError) as e:
+            # Unknown CLI options or missing language data
+            print(f"tesserocr cannot run lang={lang} config={config!r}, using pytesseract: {str(e)}")
+            self.unsupported.add((lang, config))
+            return None
+
+    def engine_name(self, lang, config):
+        return self.name if self.usable_api(lang, config) is not None else self.fallback.name
+
+    def image_to_string(self, image, lang, config):
+        api = self.usable_api(lang, config)
+        if api is None:
+            return self.fallback.image_to_string(image, lang, config)
+        api.SetImage(image)
+        return api.GetUTF8Text()
+
+    def warm_up(self, lang, config):
+        self.usable_api(lang, config)
+
+
+_default_backend = None
+
+
+def create_backend(kind=None):
+    """Backend for OCR_BACKEND (or `kind`), falling back to pytesseract if tesserocr is unusable"""
+    kind = kind or OCR_BACKEND
+    if kind not in ("auto", "tesserocr", "pytesseract"):
+        raise ValueError(f"Unknown OCR backend: {kind}")
+    if kind != "pytesseract":
+        try:
+            return TesserocrBackend()
+        except ImportError as e:
+            if kind == "tesserocr":
+                print(f"tesserocr backend unavailable, using pytesseract: {str(e)}")
+    return PytesseractBackend()
+
+
+@lru_cache(maxsize=None)
+def configured_backend_name(lang, config, kind=None):
+    """Name of the engine OCR_BACKEND (or `kind`) ends up running for these settings, without loading one.
+
+    Mirrors the fallbacks to pytesseract: tesserocr failing to import, and
+    settings it cannot run (CLI-only options, missing language data).
+    """
+    kind = kind or OCR_BACKEND
+    if kind == "pytesseract":
+        return "pytesseract"
+    try:
+        import tesserocr
+        parse_tesseract_config(config)
+        _, languages = tesserocr.get_languages()
+    except (ImportError, ValueError, RuntimeError):
+        return "pytesseract"
+    if not set(lang.split("+")) <= set(languages):
+        return "pytesseract"
+    return "tesserocr"
+
+
+def get_ocr_backend():
+    """Process-wide backend, created on first use"""
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = create_backend()
+    return _default_backend
@@ -0,0 +1,212 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class OCRCache:
+    """Two tier cache of OCR text: a bounded in-memory LRU in front of a
+    size-capped directory on disk.
+
+    Keys start with the SHA-256 of the document (or page image) bytes, so
+    every entry for one document can be invalidated together.
+    """
+
+    def __init__(self, memory_items: int = 256, disk_dir: str = None,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        self.memory_items = memory_items
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def __getstate__(self):
+        # Sent to pool workers as its settings: same disk tier, empty memory tier
+        return {"memory_items": self.memory_items, "disk_dir": self.disk_dir,
+                "disk_max_bytes": self.disk_max_bytes, "disk_bytes": self._disk_bytes}
+
+    def __setstate__(self, state):
+        # Skips the disk scan __init__ would do for every pickled copy
+        self.__init__(state["memory_items"], None, state["disk_max_bytes"])
+        self.disk_dir = state["disk_dir"]
+        self._disk_bytes = state["disk_bytes"]
+
+    @staticmethod
+    def digest(content) -> str:
+        """SHA-256 of raw bytes, used as the key prefix"""
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def make_key(digest: str, page: str, settings: str) -> str:
+        """Cache key for one page of a document under given OCR settings"""
+        settings_digest = hashlib.sha256(settings.encode()).hexdigest()[:16]
+        return f"{digest}-{page}-{settings_digest}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached text or None, promoting disk hits into memory"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+
+        text = self._disk_get(key)
+        with self._lock:
+            if text is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+            self._memory_put(key, text)
+        return text
+
+    def put(self, key: str, text: str):
+        """Store text in both tiers"""
+        with self._lock:
+            self._memory_put(key, text)
+        self._disk_put(key, text)
+
+    def invalidate(self, key: str):
+        """Drop a single entry from both tiers"""
+        with self._lock:
+            self._memory.pop(key, None)
+        path = self._disk_path(key)
+        if path and os.path.exists(path):
+            self._disk_remove(path)
+
+    def invalidate_document(self, digest: str):
+        """Drop every entry whose key belongs to the given document digest"""
+        prefix = f"{digest}-"
+        with self._lock:
+            for key in [k for k in self._memory if k.startswith(prefix)]:
+                del self._memory[key]
+        for path, _, _ in self._disk_entries():
+            if os.path.basename(path).startswith(prefix):
+                self._disk_remove(path)
+
+    def clear(self):
+        """Empty both tiers"""
+        with self._lock:
+            self._memory.clear()
+        for path, _, _ in self._disk_entries():
+            self._disk_remove(path)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Counters plus current tier sizes"""
+        with self._lock:
+            return dict(self.stats, memory_items=len(self._memory), disk_bytes=self._disk_bytes)
+
+    def _memory_put(self, key, text):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _disk_path(self, key):
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, key[:2], f"{key}.txt")
+
+    def _disk_get(self, key):
+        path = self._disk_path(key)
+        if not path:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            # Bump mtime so eviction treats this entry as recently used
+            os.utime(path)
+            return text
+        except OSError:
+            return None
+
+    def _disk_put(self, key, text):
+        path = self._disk_path(key)
+        if not path:
+            return
+        data = text.encode('utf-8')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # An overwritten entry's bytes are already counted
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += len(data) - replaced
+        if self._disk_bytes > self.disk_max_bytes:
+            self._evict_disk()
+
+    def _disk_remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes = max(0, self._disk_bytes - size)
+
+    def _disk_entries(self):
+        """(path, mtime, size) for every entry on disk"""
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return []
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith('.txt'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict_disk(self):
+        """Remove least recently used files until under 90% of the cap"""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[1])
+        # Other processes may share the directory, so resync from disk
+        total = sum(size for _, _, size in entries)
+        target = self.disk_max_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+        with self._lock:
+            self._disk_bytes = total
+
+
+_default_cache = None
+
+
+def get_default_cache() -> OCRCache:
+    """Process-wide cache configured from OCR_CACHE_* environment variables"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = OCRCache(
+            memory_items=int(os.environ.get("OCR_CACHE_ITEMS", 256)),
+            disk_dir=os.environ.get("OCR_CACHE_DIR") or None,
+            disk_max_bytes=int(os.environ.get("OCR_CACHE_DISK_MB", 512)) * 1024 * 1024
+        )
+    return _default_cache
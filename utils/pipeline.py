@@ -0,0 +1,400 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import aclosing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Tuple, Union
+from urllib.parse import urlparse
+
+from utils.image_processor import (
+    ImageProcessor, count_pdf_pages, import_ocr_modules, init_ocr_worker, ocr_image, read_pdf_page, write_temp_pdf
+)
+from utils.deadline import DeadlineExceeded, DeadlineTable, init_worker_deadlines, worker_task
+from utils.document_source import InlineDocument, LoadedDocument
+from utils.downloader import AsyncDownloader, DownloadedFile
+from utils.metrics import PAGES, POOL_QUEUE_DEPTH, POOL_TASKS, mean_stage_seconds, observe, stage, timed
+from utils.singleflight import SingleFlight
+from utils.text_parser import TextParser
+
+# Stages a page skipped by triage would otherwise have spent time in
+FULL_OCR_STAGES = ("rasterize", "preprocess", "ocr")
+
+
+def parse_page(page_no, text, text_source="ocr", timings=None):
+    """Classify one page of text and parse its line items"""
+    parser = TextParser()
+    timings = {} if timings is None else timings
+    with timed(timings, "classify"):
+        page_type = parser.detect_page_type(text)
+    with timed(timings, "parse"):
+        items = parser.parse_line_items(text)
+    return {
+        "page_no": page_no,
+        "page_type": page_type,
+        "text_source": text_source,
+        # LineItems as parsed: they pickle compactly and orjson encodes them directly
+        "bill_items": items
+    }
+
+
+def skipped_page(page_no):
+    """Page record for a page triage found is not a bill: no items, nothing to reconcile"""
+    return {"page_no": page_no, "page_type": "Other", "text_source": "skipped", "bill_items": []}
+
+
+def is_non_bill_header(header_text):
+    """Triage verdict on a page's header band: True when it is clearly not a bill page"""
+    return TextParser().classify_header(header_text) == "Other"
+
+
+async def until_deadline(awaitable, deadline=None):
+    """Await `awaitable`, cancelling it and raising DeadlineExceeded once `deadline` (time.time()) passes"""
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(0.0, deadline - time.time()))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request deadline passed")
+
+
+def init_pipeline_worker(deadlines):
+    """Process pool initializer: warm the OCR engine and watch request deadlines"""
+    init_ocr_worker()
+    init_worker_deadlines(deadlines)
+
+
+# Process pool entry points return (result, stage timings) so the serving
+# process can publish worker-side timings to its own metrics. `token` is the
+# request's DeadlineTable token: work stops once that request is over
+
+def parse_cached_page(page_no, text, token=None):
+    """Process pool entry point: parse one page whose text came from the cache"""
+    timings = {}
+    with worker_task(token):
+        return parse_page(page_no, text, "cache", timings), timings
+
+
+def ocr_and_parse_image(content, token=None):
+    """Process pool entry point: OCR and parse a single image document"""
+    timings = {}
+    with worker_task(token):
+        text = ImageProcessor().extract_text_from_image(content, timings)
+        return (text, parse_page("1", text, "ocr", timings)), timings
+
+
+def read_and_parse_pdf_page(pdf_path, page_number, token=None):
+    """Process pool entry point: read (text layer or OCR) and parse one PDF page"""
+    timings = {}
+    with worker_task(token):
+        text, source = read_pdf_page(pdf_path, page_number, timings, should_skip=is_non_bill_header)
+        if source == "skipped":
+            return (text, skipped_page(str(page_number))), timings
+        return (text, parse_page(str(page_number), text, source, timings)), timings
+
+
+def warm_up_worker():
+    """Process pool entry point: push a blank page through preprocessing and OCR.
+
+    Pages in the OCR code, the tesseract binary and its language data, so
+    the first real page does not pay for them. Returns the worker's pid.
+    """
+    from PIL import Image
+
+    with worker_task(None):
+        ocr_image(Image.new("L", (240, 80), 255))
+    return os.getpid()
+
+
+def _consume_result(task):
+    """Done callback for abandoned tasks so their errors are not logged as unretrieved"""
+    if not task.cancelled():
+        task.exception()
+
+
+class BillPipeline:
+    """Runs the bill pipeline off the event loop.
+
+    Downloads stream through a pooled asyncio client, file reads and cache
+    lookups go to a thread pool, OCR and parsing go to a process pool. PDF
+    pages are read concurrently, one pool task per page, with at most
+    `page_window` pages in flight per document so finished pages never
+    pile up ahead of a slow consumer. Sizes come from the constructor or
+    the OCR_WORKERS / IO_WORKERS / PAGE_WINDOW environment variables.
+
+    A document can carry a deadline. Past it, or as soon as its consumer
+    stops (client gone), queued pages are dropped and pages running in
+    workers are killed along with their tesseract and poppler processes.
+    """
+
+    def __init__(self, ocr_workers: int = None, io_workers: int = None, page_window: int = None):
+        self.ocr_workers = ocr_workers or int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+        self.io_workers = io_workers or int(os.environ.get("IO_WORKERS", 16))
+        self.page_window = page_window or int(os.environ.get("PAGE_WINDOW", self.ocr_workers * 2))
+        self.processor = ImageProcessor()
+        self.downloader = AsyncDownloader()
+        self._jobs = SingleFlight("document")
+        self._process_pool = None
+        self._thread_pool = None
+        self._outstanding = {"cpu": 0, "io": 0}
+        self._deadlines = None
+
+    @property
+    def deadlines(self) -> DeadlineTable:
+        # Created on first use rather than at import, so gunicorn web workers
+        # forked from a preloaded app do not share one table
+        if self._deadlines is None:
+            self._deadlines = DeadlineTable()
+        return self._deadlines
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # Workers load the OCR engine once at startup and keep it for every page
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.ocr_workers, initializer=init_pipeline_worker, initargs=(self.deadlines,)
+            )
+        return self._process_pool
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.io_workers, thread_name_prefix="bill-io"
+            )
+        return self._thread_pool
+
+    async def run_io(self, func, *args):
+        """Run a blocking I/O call on the thread pool"""
+        loop = asyncio.get_running_loop()
+        return await self._run_tracked("io", self.io_workers, loop.run_in_executor(self.thread_pool, func, *args))
+
+    async def run_cpu(self, func, *args):
+        """Run a CPU bound call on the process pool"""
+        loop = asyncio.get_running_loop()
+        return await self._run_tracked("cpu", self.ocr_workers, loop.run_in_executor(self.process_pool, func, *args))
+
+    async def _run_tracked(self, pool, workers, future):
+        """Await a pool future while keeping the pool task and queue depth gauges current"""
+        self._outstanding[pool] += 1
+        POOL_TASKS.labels(pool).inc()
+        POOL_QUEUE_DEPTH.labels(pool).set(max(0, self._outstanding[pool] - workers))
+        try:
+            return await future
+        finally:
+            self._outstanding[pool] -= 1
+            POOL_TASKS.labels(pool).dec()
+            POOL_QUEUE_DEPTH.labels(pool).set(max(0, self._outstanding[pool] - workers))
+
+    async def warm_up(self) -> int:
+        """Load the OCR stack, start the worker pools and prime OCR in every worker.
+
+        The OCR modules are imported (off the event loop) before the process
+        pool forks so workers inherit them. Returns the number of distinct
+        workers that ran a warm-up page; raises if OCR is unusable.
+        """
+        await self.run_io(import_ocr_modules)
+        pids = await asyncio.gather(*(self.run_cpu(warm_up_worker) for _ in range(self.ocr_workers)))
+        return len(set(pids))
+
+    async def run_cpu_timed(self, timings, func, *args):
+        """Run a timed process pool entry point and publish its stage timings.
+
+        Whatever part of the round trip the worker did not account for is
+        recorded as "pool_wait" (queueing plus pickling).
+        """
+        start = time.perf_counter()
+        result, worker_timings = await self.run_cpu(func, *args)
+        worker_timings["pool_wait"] = max(0.0, time.perf_counter() - start - sum(worker_timings.values()))
+        observe(worker_timings, timings)
+        return result
+
+    async def process(self, document: Union[str, InlineDocument], timings: Dict = None,
+                      deadline: float = None) -> List[Dict]:
+        """Download, OCR and parse a document without blocking the event loop.
+
+        Concurrent calls for the same URL or path share one job (client
+        retries, fan-out). Each caller still gives up at its own deadline,
+        the job only stops once every caller has, and every caller gets the
+        job's stage timings.
+        """
+        if not isinstance(document, str):
+            return await self.collect_pages(document, timings, deadline)
+        job = self._jobs.run(document, lambda: self.shared_job(document))
+        pages, job_timings = await until_deadline(job, deadline)
+        if timings is not None:
+            for name, seconds in job_timings.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+        return pages
+
+    def in_flight(self, document: Union[str, InlineDocument]) -> bool:
+        """Whether process() calls for this document would join a running job"""
+        return isinstance(document, str) and self._jobs.in_flight(document)
+
+    async def shared_job(self, document: str) -> Tuple[List[Dict], Dict]:
+        timings = {}
+        return await self.collect_pages(document, timings), timings
+
+    async def collect_pages(self, document: Union[str, InlineDocument], timings: Dict = None,
+                            deadline: float = None) -> List[Dict]:
+        async with aclosing(self.iter_pages(document, timings, deadline)) as pages:
+            return [page async for page in pages]
+
+    async def iter_pages(self, document: Union[str, InlineDocument], timings: Dict = None,
+                         deadline: float = None) -> AsyncIterator[Dict]:
+        """Yield parsed pages in page order, each as soon as it is ready.
+
+        `document` is a URL, a local path or an InlineDocument sent with the
+        request. Stage times are published as metrics and, when a `timings`
+        dict is passed, summed into it per stage (OCR stages add up across pages).
+        Raises DeadlineExceeded once `deadline` (a time.time() value) passes.
+        """
+        token = self.deadlines.acquire(deadline)
+        try:
+            async with aclosing(self._iter_pages(document, timings, deadline, token)) as pages:
+                async for page in pages:
+                    yield page
+        finally:
+            # Stops whatever of this document is still running in the workers
+            self.deadlines.release(token)
+
+    async def _iter_pages(self, document, timings, deadline, token):
+        loaded = await until_deadline(self.load_document(document, timings), deadline)
+        try:
+            with stage("cache_lookup", timings):
+                # hashlib reads the buffer (or memory map) in place
+                digest = await self.run_io(self.processor.cache.digest, loaded.buffer)
+                cached = await self.run_io(self.processor.get_cached_pages, digest)
+            if cached is not None:
+                for page in cached:
+                    PAGES.labels("cache").inc()
+                    if page["source"] == "skipped":
+                        yield skipped_page(page["page_no"])
+                    else:
+                        yield await until_deadline(self.run_cpu_timed(
+                            timings, parse_cached_page, page["page_no"], page["text"], token
+                        ), deadline)
+                return
+
+            texts = []
+            if loaded.is_pdf:
+                async with aclosing(self.read_pdf_pages(loaded, timings, deadline, token)) as pdf_pages:
+                    async for text, page in pdf_pages:
+                        PAGES.labels(page["text_source"]).inc()
+                        texts.append({"page_no": page["page_no"], "text": text, "source": page["text_source"]})
+                        yield page
+            else:
+                # Workers open local images themselves; only in-memory images are pickled across
+                content = loaded.path or (loaded.buffer if isinstance(loaded.buffer, bytes) else bytes(loaded.buffer))
+                text, page = await until_deadline(
+                    self.run_cpu_timed(timings, ocr_and_parse_image, content, token), deadline
+                )
+                PAGES.labels("ocr").inc()
+                texts.append({"page_no": page["page_no"], "text": text})
+                yield page
+            with stage("cache_store", timings):
+                await self.run_io(self.processor.store_cached_pages, digest, texts)
+        finally:
+            loaded.close()
+
+    async def load_document(self, document: Union[str, InlineDocument], timings: Dict = None) -> LoadedDocument:
+        """Document bytes from an inline payload, a URL (pooled async download) or a memory mapped local file.
+
+        Downloads past the downloader's `spool_bytes` stay in their temp file, memory mapped like local files.
+        """
+        if isinstance(document, InlineDocument):
+            with stage("decode", timings):
+                return await self.run_io(document.load, self.downloader.max_bytes)
+        if self.processor.is_url(document):
+            with stage("download", timings):
+                body = await self.downloader.download(document)
+                name = urlparse(document).path
+                if isinstance(body, DownloadedFile):
+                    buffer = await self.run_io(self.processor.map_local_file, body.path)
+                    return LoadedDocument(buffer, name, path=body.path, owner=body)
+                return LoadedDocument(body, name=name)
+        with stage("read", timings):
+            return LoadedDocument(await self.run_io(self.processor.map_local_file, document), document, path=document)
+
+    async def read_pdf_pages(self, loaded: LoadedDocument, timings: Dict = None, deadline: float = None,
+                             token=None) -> AsyncIterator[Tuple[str, Dict]]:
+        """Read and parse PDF pages over the process pool, yielding (text, page) in order.
+
+        Pages with a usable text layer skip rasterization and OCR entirely;
+        scanned pages whose header marks them as not a bill (discharge
+        summaries, lab reports, ID scans) are triaged out before full OCR.
+        PDFs on disk (local files, large downloads) are read in place; others are spilled to a temp file.
+        """
+        pdf_path = loaded.path
+        if pdf_path is None:
+            with stage("pdf_write", timings):
+                pdf_path = await self.run_io(write_temp_pdf, loaded.buffer)
+        pending = deque()
+        try:
+            with stage("pdf_info", timings):
+                page_count = await self.run_io(count_pdf_pages, pdf_path)
+            next_page = 1
+            while next_page <= page_count or pending:
+                while next_page <= page_count and len(pending) < self.page_window:
+                    pending.append(asyncio.ensure_future(
+                        self.run_cpu_timed(timings, read_and_parse_pdf_page, pdf_path, next_page, token)
+                    ))
+                    next_page += 1
+                yield await until_deadline(pending.popleft(), deadline)
+        finally:
+            # Reached on errors and when the consumer stops early (client gone)
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_consume_result)
+            if loaded.path is None:
+                await self.run_io(os.remove, pdf_path)
+
+    def build_response_data(self, pages: List[Dict], timings: Dict = None) -> Dict:
+        """Assemble the ResponseData payload from parsed pages"""
+        all_items = [item for page in pages for item in page["bill_items"]]
+        return {
+            "pagewise_line_items": pages,
+            "total_item_count": len(all_items),
+            "reconciled_amount": round(sum(item.item_amount for item in all_items), 2),
+            **self.triage_report(pages, timings)
+        }
+
+    def triage_report(self, pages: List[Dict], timings: Dict = None) -> Dict:
+        """Pages skipped by triage and the net seconds it saved on this request.
+
+        The saving is the skipped pages times this document's average full
+        OCR cost per page (the process-wide average when no page of it was
+        fully OCR'd), minus the time spent triaging every page. It is None
+        when no timings were collected or there is nothing to estimate from.
+        """
+        skipped = [page["page_no"] for page in pages if page.get("text_source") == "skipped"]
+        if timings is None:
+            return {"skipped_pages": skipped, "triage_seconds_saved": None}
+        if "triage" not in timings:
+            # Nothing was triaged on this request (cache hit, text layers, triage off)
+            return {"skipped_pages": skipped, "triage_seconds_saved": 0.0}
+        ocr_pages = sum(1 for page in pages if page.get("text_source") == "ocr")
+        if ocr_pages:
+            page_seconds = sum(timings.get(name, 0.0) for name in FULL_OCR_STAGES) / ocr_pages
+        else:
+            page_seconds = mean_stage_seconds(FULL_OCR_STAGES)
+        if page_seconds is None:
+            return {"skipped_pages": skipped, "triage_seconds_saved": None}
+        return {
+            "skipped_pages": skipped,
+            "triage_seconds_saved": round(len(skipped) * page_seconds - timings["triage"], 3)
+        }
+
+    async def close(self):
+        """Close the download session, then stop both worker pools"""
+        await self.downloader.close()
+        self.shutdown()
+
+    def shutdown(self):
+        """Stop both worker pools"""
+        if self._process_pool is not None:
+            self._process_pool.shutdown(cancel_futures=True)
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(cancel_futures=True)
+            self._thread_pool = None
@@ -0,0 +1,272 @@
+import re
+from typing import List, Optional, Tuple
+
+from utils.line_item import LineItem
+
+# OCR table rows are never this long; anything longer is treated as noise
+MAX_LINE_LENGTH = 1000
+
+_TOKEN = re.compile(r'\S+')
+# Numbers as \d+(?:\.\d*)? - the same strings as \d+\.?\d*, but with one way to
+# split a digit run, so a long run cannot backtrack quadratically
+_NUM = re.compile(r'\d+(?:\.\d*)?')
+_WORD = re.compile(r'\w+')
+_DATE = re.compile(r'\d{2}/\d{2}/\d{4}')
+_RATE_X_QTY_AMOUNT = re.compile(r'(\d+(?:\.\d*)?)\s*x\s*(\d+(?:\.\d*)?)\s+(\d+(?:\.\d*)?)')
+_MEDICINE_NAME = re.compile(
+    r'[A-Z][A-Za-z\s]+(?:[\d\.]*(?:\s*[MG]G)?\s*'
+    r'(?:TAB|CAP|INJ|SYR|SYP|CREAM|OINTMENT|GEL|LOTION|SPRAY|POWDER|SOLUTION|DROPS)?)'
+)
+_MEDICINE_FORM_NAME = re.compile(r'([A-Z][A-Za-z]+\s+[A-Z][A-Za-z]+\s+(?:TAB|CAP|INJ|SYR))')
+_ASCII_LETTERS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
+_ASCII_UPPER = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+
+def _next_true(flags: List[bool]) -> List[int]:
+    """For every index, the first index at or after it whose flag is set (len if none)"""
+    result = [len(flags)] * (len(flags) + 1)
+    for k in range(len(flags) - 1, -1, -1):
+        result[k] = k if flags[k] else result[k + 1]
+    return result
+
+
+def trailing_number_start(text: str) -> int:
+    """Offset where a trailing \\d+\\.?\\d* starts, or -1; linear time unlike
+    re.search(r'(\\d+\\.?\\d*)$'), which goes cubic on long digit runs"""
+    # Walk back over the trailing run of digits and at most one dot
+    start = len(text)
+    dots = 0
+    while start > 0:
+        ch = text[start - 1]
+        if ch == '.':
+            if dots == 1:
+                break
+            dots += 1
+        elif not ch.isdecimal():
+            break
+        start -= 1
+    while start < len(text) and text[start] == '.':
+        start += 1
+    return -1 if start == len(text) else start
+
+
+def trailing_amount(line: str) -> Optional[float]:
+    """Value of the number ending the line, if any"""
+    start = trailing_number_start(line)
+    return None if start < 0 else float(line[start:])
+
+
+class RowTokens:
+    """Whitespace tokens of one line with the shape flags every grammar needs"""
+
+    def __init__(self, line: str):
+        self.line = line
+        self.texts = texts = line.split()
+        self.count = len(texts)
+        # "12.5" - \d+\.?\d* as a whole token
+        self.is_num = [t[0].isdecimal() and t.replace('.', '', 1).isdecimal() for t in texts]
+        self.digit_start = [t[0].isdecimal() for t in texts]
+        self.digit_end = [t[-1].isdecimal() for t in texts]
+        self._spans = None
+
+    @property
+    def spans(self):
+        """(start, end) offsets of each token, only computed once a row matches"""
+        if self._spans is None:
+            self._spans = [match.span() for match in _TOKEN.finditer(self.line)]
+        return self._spans
+
+    def serial_dots(self):
+        """Flags for "12." tokens - the "(\\d+)\\." serial of hospital rows"""
+        return [t[-1] == '.' and len(t) > 1 and t[-2].isdecimal() for t in self.texts]
+
+    def gap(self, left: int, right: int) -> int:
+        """Whitespace width between two adjacent tokens"""
+        return self.spans[right][0] - self.spans[left][1]
+
+    def first_name_end(self, after: int, tails: List[int]) -> int:
+        """Index of the token where the row tail starts, given that a lazy
+        `\\s+(.+?)\\s+` name begins after token `after`; -1 if none.
+
+        Mirrors the regex: a name made of at least one token wins, and a
+        whitespace-only name is only possible across a gap of 3+ spaces.
+        """
+        if after + 2 <= self.count and tails[after + 2] < self.count:
+            return tails[after + 2]
+        if after + 1 < self.count and tails[after + 1] == after + 1 and self.gap(after, after + 1) >= 3:
+            return after + 1
+        return -1
+
+    def name(self, after: int, tail: int) -> str:
+        return self.line[self.spans[after][1]:self.spans[tail][0]].strip()
+
+
+class RowEngine:
+    """Single pass replacement for the TextParser regex cascade.
+
+    Each line is tokenized once and the hospital, pharmacy and medicine
+    grammars are matched against the token shapes using precomputed
+    "next match" tables, so the cost per line is linear in its length
+    (and lines over MAX_LINE_LENGTH are rejected outright). Results are
+    the same items the hospital, pharmacy and structured-item regexes of
+    the old cascade produce (kept as the oracle in test_text_parser.py).
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def extract_item(self, line: str, all_lines: List[str], current_index: int) -> Optional[Tuple[LineItem, int]]:
+        """Match one stripped line against every row grammar: (item, lines it spans) or None.
+
+        Medicine rows may take their amount from the next line, so they
+        always span two lines; table rows span one.
+        """
+        if len(line) > MAX_LINE_LENGTH:
+            return None
+        tokens = RowTokens(line)
+        item = self.match_hospital(tokens) or self.match_pharmacy(tokens)
+        if item:
+            return item, 1
+        item = self.match_medicine(line, all_lines, current_index)
+        return (item, 2) if item else None
+
+    def match_hospital(self, tokens: RowTokens) -> Optional[LineItem]:
+        """'1. 15/11/2025 R1001 2D echo 1180.00 x 1.00 1180.00' and its shorter variants"""
+        if '.' not in tokens.line:
+            return None
+        serial_dot = tokens.serial_dots()
+        if not any(serial_dot):
+            return None
+        n = tokens.count
+        texts = tokens.texts
+
+        tail_matches = [_RATE_X_QTY_AMOUNT.match(tokens.line, start) if tokens.digit_start[k] else None
+                        for k, (start, _) in enumerate(tokens.spans)]
+        x_tails = _next_true([m is not None for m in tail_matches])
+
+        # Full format: serial, date, code, name, rate x qty, amount
+        for i in range(n - 3):
+            if serial_dot[i] and _DATE.fullmatch(texts[i + 1]) and _WORD.fullmatch(texts[i + 2]):
+                k = tokens.first_name_end(i + 2, x_tails)
+                if k >= 0:
+                    rate, quantity, amount = tail_matches[k].groups()
+                    return self.hospital_item(tokens.name(i + 2, k), rate, quantity, amount)
+
+        # Medium format: serial, name, rate x qty, amount
+        for i in range(n):
+            if serial_dot[i]:
+                k = tokens.first_name_end(i, x_tails)
+                if k >= 0:
+                    rate, quantity, amount = tail_matches[k].groups()
+                    return self.hospital_item(tokens.name(i, k), rate, quantity, amount)
+
+        # Simple format: serial, name, rate, amount
+        pair_tails = _next_true([tokens.is_num[k] and k + 1 < n and tokens.digit_start[k + 1]
+                                 for k in range(n)])
+        for i in range(n):
+            if serial_dot[i]:
+                k = tokens.first_name_end(i, pair_tails)
+                if k >= 0:
+                    amount = _NUM.match(texts[k + 1]).group()
+                    return self.hospital_item(tokens.name(i, k), texts[k], "1", amount)
+        return None
+
+    def hospital_item(self, name, rate, quantity, amount) -> LineItem:
+        return LineItem(self.parser.clean_item_name(name), float(amount), float(rate), float(quantity))
+
+    def match_pharmacy(self, tokens: RowTokens) -> Optional[LineItem]:
+        """Pharmacy table rows, short 'S/N name qty rate amount' rows and 'NAME amount'"""
+        n = tokens.count
+        texts, is_num = tokens.texts, tokens.is_num
+        if n < 2 or not any(is_num):
+            return None
+
+        # Full table: serial, hsn, batch, expiry, name, four numbers, trailing int
+        if n >= 9:
+            table_tails = _next_true([k + 4 < n and is_num[k] and is_num[k + 1] and is_num[k + 2]
+                                      and is_num[k + 3] and tokens.digit_start[k + 4]
+                                      for k in range(n)])
+        else:
+            table_tails = None
+        if table_tails and table_tails[0] < n:
+            for i in range(n - 4):
+                if tokens.digit_end[i] and _WORD.fullmatch(texts[i + 1]) and _WORD.fullmatch(texts[i + 2]):
+                    k = tokens.first_name_end(i + 3, table_tails)
+                    if k >= 0:
+                        # The regex stops at its first match even if the name is rejected
+                        item = self.pharmacy_item(tokens.name(i + 3, k), texts[k + 3])
+                        if item:
+                            return item
+                        break
+
+        # Short row ending in three numbers
+        if n >= 4 and is_num[-1] and is_num[-2] and is_num[-3]:
+            tail = n - 3
+            end_tails = [n] * (n + 1)
+            end_tails[tail] = tail
+            end_tails[:tail] = [tail] * tail
+            for i in range(tail):
+                if tokens.digit_end[i]:
+                    k = tokens.first_name_end(i, end_tails)
+                    if k >= 0:
+                        item = self.pharmacy_item(tokens.name(i, k), texts[-1])
+                        if item:
+                            return item
+                        break
+
+        # Capitalised name followed by a final amount
+        if is_num[-1]:
+            line = tokens.line
+            name_end = tokens.spans[-1][0]
+            run_start = name_end
+            while run_start > 0 and (line[run_start - 1] in _ASCII_LETTERS or line[run_start - 1].isspace()):
+                run_start -= 1
+            for p in range(run_start, name_end):
+                if line[p] in _ASCII_UPPER:
+                    if name_end - p >= 3:
+                        return self.pharmacy_item(line[p:name_end - 1].strip(), texts[-1])
+                    break
+        return None
+
+    def pharmacy_item(self, name, amount) -> Optional[LineItem]:
+        item_name = self.parser.clean_item_name(name)
+        if not self.parser.looks_like_medicine(item_name):
+            return None
+        return LineItem(item_name, float(amount))
+
+    def match_medicine(self, line: str, all_lines: List[str], current_index: int) -> Optional[LineItem]:
+        """Medicine name whose amount ends this line or the next one"""
+        start = -1
+        for p in range(len(line) - 1):
+            if line[p] in _ASCII_UPPER and (line[p + 1] in _ASCII_LETTERS or line[p + 1].isspace()):
+                start = p
+                break
+        if start < 0:
+            return None
+
+        amount = self.find_amount_nearby(line, all_lines, current_index)
+        if not amount:
+            return None
+
+        item_name = _MEDICINE_NAME.match(line, start).group().strip()
+        if not self.parser.looks_like_medicine(item_name):
+            match = _MEDICINE_FORM_NAME.search(line)
+            if not match:
+                return None
+            item_name = match.group(1).strip()
+            if not self.parser.looks_like_medicine(item_name):
+                return None
+
+        return LineItem(item_name, amount)
+
+    def find_amount_nearby(self, current_line: str, all_lines: List[str], current_index: int) -> Optional[float]:
+        """Trailing amount of this line, else a plausible one ending the next, without a backtracking regex"""
+        amount = trailing_amount(current_line)
+        if amount is not None:
+            return amount
+
+        if current_index + 1 < len(all_lines):
+            amount = trailing_amount(all_lines[current_index + 1].strip())
+            if amount is not None and 0.1 <= amount <= 100000:
+                return amount
+        return None
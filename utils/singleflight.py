@@ -0,0 +1,49 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+from utils.metrics import COALESCED
+
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one task.
+
+    The first caller starts `factory()`; callers arriving while it runs
+    await the same task and get the same result or exception. A caller
+    that gives up (cancelled, deadline passed) leaves the task running for
+    the others; the task is only cancelled when its last caller is gone.
+    `kind` labels the bill_coalesced_total metric.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(factory()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            COALESCED.labels(self.kind).inc()
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+
+    def _forget(self, key, call):
+        # A new call for the key may already have replaced a cancelled one
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -1,8 +1,43 @@
+import math
 import re
-from typing import List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Tuple, Union
+
+from utils.line_item import LineItem
+from utils.keyword_matcher import KeywordMatcher, get_default_matcher
+from utils.row_engine import MAX_LINE_LENGTH, RowEngine, trailing_number_start
+
+_SEPARATOR_LINE = re.compile(r'^[\.\-\=\*\s]*$')
+_LEADING_NUMBER = re.compile(r'^\d+\.?\s*')
+_X_QUANTITY = re.compile(r'\s+[Xx]\s+\d+\.?\d*')
+_WHITESPACE = re.compile(r'\s+')
+_CAPITALISED = re.compile(r'^[A-Z][a-z]+(?:\s+[A-Z][a-z]*)*')
+_AMOUNT = re.compile(r'\d+\.\d{2}\b')
+# Lines with a digit: every row grammar needs one on the line itself, except
+# medicine rows, whose amount may end the next line instead
+_DIGIT_LINE = re.compile(r'^[^\d\n]*\d[^\n]*', re.MULTILINE)
+
+# Pages per process pool task in TextParser.parse_pages
+PARSE_CHUNK_PAGES = 256
+
+
+def _parse_chunk(keywords, chunk):
+    """Process pool entry point for TextParser.parse_pages"""
+    parser = TextParser(keywords)
+    return [(key, parser.scan_line_items(text)) for key, text in chunk]
+
 
 class TextParser:
-    def parse_line_items(self, text: str) -> List[Dict]:
+    def __init__(self, keywords: Dict[str, List[str]] = None):
+        # Keyword classes default to DEFAULT_KEYWORDS (see utils/keyword_matcher.py)
+        self.keywords = keywords
+        self.keyword_matcher = KeywordMatcher(keywords) if keywords else get_default_matcher()
+        self.row_engine = RowEngine(self)
+        # Header keywords found in the whole page line up with the stripped lines
+        # parse_line_items checks only if none starts or ends with whitespace
+        self._page_header_scan = all(word == word.strip() for word in self.keyword_matcher.keywords.get("header", []))
+    
+    def parse_line_items(self, text: str) -> List[LineItem]:
         """Extract line items from bill text with better accuracy"""
         items = []
         lines = text.split('\n')
@@ -16,237 +51,179 @@ class TextParser:
                 i += 1
                 continue
             
-            # Try to extract item from current line
-            item = self.extract_hospital_item(line) or \
-                   self.extract_pharmacy_item(line) or \
-                   self.extract_structured_item(line, lines, i)
+            # Try to extract item from current line in a single pass over its tokens
+            match = self.row_engine.extract_item(line, lines, i)
             
-            if item and self.is_valid_item(item):
+            if match and self.is_valid_item(match[0]):
+                item, line_count = match
                 items.append(item)
-                # Skip next line if we consumed multi-line item
-                if item.get('multi_line', False):
-                    i += 1
+                # Skip the next line too if the item spans it
+                i += line_count - 1
             
             i += 1
         
         return items
     
-    def is_header_or_total(self, line: str) -> bool:
-        """Check if line is a header, total, or other non-item text"""
-        lower_line = line.lower()
-        skip_patterns = [
-            'total', 'subtotal', 'grand total', 'net amount', 'final bill',
-            'bill no', 'patient name', 'page', 'date', 's.no', 'particulars',
-            'rate', 'qty', 'amount', 'hospita', 'consult', 'address',
-            'description', 'hsn', 'batch', 'exp', 'gst', 'tax', 'discount'
-        ]
-        
-        return any(pattern in lower_line for pattern in skip_patterns) or \
-               re.match(r'^[\.\-\=\*\s]*$', line) or \
-               len(line) < 3
-    
-    def extract_hospital_item(self, line: str) -> Dict:
-        """Extract items from hospital bill format like train_sample_1"""
-        # Pattern: "1. 15/11/2025 R1001 2D echocardiography 1180.00 x 1.00 1180.00"
-        patterns = [
-            r'(\d+)\.\s+(\d{2}/\d{2}/\d{4})\s+(\w+)\s+(.+?)\s+(\d+\.?\d*)\s*x\s*(\d+\.?\d*)\s+(\d+\.?\d*)',
-            r'(\d+)\.\s+(.+?)\s+(\d+\.?\d*)\s*x\s*(\d+\.?\d*)\s+(\d+\.?\d*)',
-            r'(\d+)\.\s+(.+?)\s+(\d+\.?\d*)\s+(\d+\.?\d*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, line)
-            if match:
-                try:
-                    groups = match.groups()
-                    if len(groups) == 7:  # Full hospital format
-                        item_name = groups[3].strip()
-                        rate = float(groups[4])
-                        quantity = float(groups[5])
-                        amount = float(groups[6])
-                    elif len(groups) == 5:  # Medium format
-                        item_name = groups[1].strip()
-                        rate = float(groups[2])
-                        quantity = float(groups[3])
-                        amount = float(groups[4])
-                    elif len(groups) == 4:  # Simple format
-                        item_name = groups[1].strip()
-                        rate = float(groups[2])
-                        quantity = 1.0
-                        amount = float(groups[3])
-                    else:
-                        continue
-                    
-                    # Clean item name
-                    item_name = self.clean_item_name(item_name)
-                    
-                    return {
-                        "item_name": item_name,
-                        "item_amount": amount,
-                        "item_rate": rate,
-                        "item_quantity": quantity
-                    }
-                    
-                except (ValueError, IndexError):
+    def scan_line_items(self, text: str) -> List[LineItem]:
+        """Same items as parse_line_items, without visiting every line.
+
+        One multiline scan finds the lines holding a digit, which are the
+        only ones the table grammars can match. A digitless line is only
+        parsed, as a medicine row, when the line after it ends in a number
+        it could take as its amount. Header keywords are found with one
+        scan of the whole page rather than per line.
+        """
+        items = []
+        headers = self.keyword_matcher.offsets(text, "header") if self._page_header_scan else None
+        # Index into headers of the first keyword not before the line being checked
+        cursor = 0
+        # Start offset of the line the previous item spans into, which is not parsed on its own
+        consumed = -1
+        previous_end = -1
+        for match in _DIGIT_LINE.finditer(text):
+            start, end = match.span()
+            line = match.group()
+            if start > 0 and previous_end != start - 1 and trailing_number_start(line.strip()) >= 0:
+                previous_start = text.rfind('\n', 0, start - 1) + 1
+                if headers is not None:
+                    while cursor < len(headers) and headers[cursor] < previous_start:
+                        cursor += 1
+                if previous_start != consumed and (headers is None or cursor == len(headers)
+                                                   or headers[cursor] >= start):
+                    item = self._scan_medicine_line(text[previous_start:start - 1], line, headers is None)
+                    if item:
+                        items.append(item)
+                        consumed = start
+            previous_end = end
+            if start == consumed:
+                continue
+            if headers is not None:
+                while cursor < len(headers) and headers[cursor] < start:
+                    cursor += 1
+                if cursor < len(headers) and headers[cursor] < end:
                     continue
-        
-        return None
+            if end < len(text):
+                following = text.find('\n', end + 1)
+                next_line = text[end + 1:following if following >= 0 else len(text)]
+            else:
+                next_line = None
+            stripped = line.strip()
+            if len(stripped) < 3 or headers is None and self.is_header_or_total(stripped):
+                continue
+            match = self.row_engine.extract_item(stripped, (line, next_line) if next_line is not None else (line,), 0)
+            if match and self.is_valid_item(match[0]):
+                items.append(match[0])
+                if match[1] == 2:
+                    consumed = end + 1
+        return items
     
-    def extract_pharmacy_item(self, line: str) -> Dict:
-        """Extract items from pharmacy bills like train_sample_2"""
-        # Pattern for table rows with medicine names and amounts
-        patterns = [
-            # Pharmacy table format: "1 3004 13825755 09/28 CANNULA 22 NO 1 105.00 0.00 105.00 5"
-            r'(\d+)\s+(\w+)\s+(\w+)\s+(\S+)\s+(.+?)\s+(\d+\.?\d*)\s+(\d+\.?\d*)\s+(\d+\.?\d*)\s+(\d+\.?\d*)\s+(\d+)',
-            # Simpler pharmacy format
-            r'(\d+)\s+(.+?)\s+(\d+\.?\d*)\s+(\d+\.?\d*)\s+(\d+\.?\d*)$',
-            # Medicine name followed by amount
-            r'([A-Z][A-Za-z\s]+(?:\s+[A-Z][A-Za-z]*)*)\s+(\d+\.?\d*)$'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, line)
-            if match:
-                try:
-                    groups = match.groups()
-                    if len(groups) == 10:  # Full pharmacy table
-                        item_name = groups[4].strip()
-                        amount = float(groups[8])  # Amount column
-                    elif len(groups) == 5:  # Medium format
-                        item_name = groups[1].strip()
-                        amount = float(groups[4])
-                    elif len(groups) == 2:  # Simple name + amount
-                        item_name = groups[0].strip()
-                        amount = float(groups[1])
-                    else:
-                        continue
-                    
-                    # Clean and validate
-                    item_name = self.clean_item_name(item_name)
-                    if not self.looks_like_medicine(item_name):
-                        continue
-                    
-                    return {
-                        "item_name": item_name,
-                        "item_amount": amount,
-                        "item_rate": None,
-                        "item_quantity": None
-                    }
-                    
-                except (ValueError, IndexError):
-                    continue
-        
-        return None
+    def _scan_medicine_line(self, raw_line: str, next_line: str, check_header: bool) -> Optional[LineItem]:
+        """A digitless line as a medicine row priced on the next line, for scan_line_items.
+
+        Table rows need a digit on the line itself, so this is all
+        extract_item could match.
+        """
+        line = raw_line.strip()
+        if not 3 <= len(line) <= MAX_LINE_LENGTH or check_header and self.is_header_or_total(line):
+            return None
+        item = self.row_engine.match_medicine(line, (raw_line, next_line), 0)
+        return item if item and self.is_valid_item(item) else None
     
-    def extract_structured_item(self, line: str, all_lines: List[str], current_index: int) -> Dict:
-        """Extract structured items that might span multiple lines"""
-        # Look for medicine-like patterns
-        medicine_patterns = [
-            r'([A-Z][A-Za-z\s]+(?:[\d\.]*(?:\s*[MG]G)?\s*(?:TAB|CAP|INJ|SYR|SYP|CREAM|OINTMENT|GEL|LOTION|SPRAY|POWDER|SOLUTION|DROPS)?))',
-            r'([A-Z][A-Za-z]+\s+[A-Z][A-Za-z]+\s+(?:TAB|CAP|INJ|SYR))'
-        ]
-        
-        for pattern in medicine_patterns:
-            match = re.search(pattern, line)
-            if match:
-                item_name = match.group(1).strip()
-                
-                # Look for amount in current or next line
-                amount = self.find_amount_nearby(line, all_lines, current_index)
-                
-                if amount and self.looks_like_medicine(item_name):
-                    return {
-                        "item_name": item_name,
-                        "item_amount": amount,
-                        "item_rate": None,
-                        "item_quantity": None,
-                        "multi_line": True
-                    }
-        
-        return None
+    def parse_pages(self, pages: Union[Mapping[Hashable, str], Iterable[Tuple[Hashable, str]]],
+                    workers: int = None) -> Dict[Hashable, List[LineItem]]:
+        """Line items of many pages at once, e.g. to re-parse archived OCR text.
+
+        `pages` maps a key, typically (document, page_no), to the page text;
+        the result maps the same keys to their items. With `workers` > 1 the
+        pages are parsed in that many processes, PARSE_CHUNK_PAGES at a time.
+        """
+        pages = list(pages.items() if isinstance(pages, Mapping) else pages)
+        if not workers or workers <= 1 or len(pages) <= PARSE_CHUNK_PAGES:
+            return {key: self.scan_line_items(text) for key, text in pages}
+        
+        chunk_size = min(PARSE_CHUNK_PAGES, math.ceil(len(pages) / workers))
+        chunks = [pages[i:i + chunk_size] for i in range(0, len(pages), chunk_size)]
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for parsed in executor.map(_parse_chunk, [self.keywords] * len(chunks), chunks):
+                results.update(parsed)
+        return results
     
-    def find_amount_nearby(self, current_line: str, all_lines: List[str], current_index: int) -> float:
-        """Find amount near the current line"""
-        # Check current line
-        amount_match = re.search(r'(\d+\.?\d*)$', current_line)
-        if amount_match:
-            try:
-                return float(amount_match.group(1))
-            except ValueError:
-                pass
-        
-        # Check next line
-        if current_index + 1 < len(all_lines):
-            next_line = all_lines[current_index + 1].strip()
-            amount_match = re.search(r'(\d+\.?\d*)$', next_line)
-            if amount_match:
-                try:
-                    amount = float(amount_match.group(1))
-                    # Validate it's a reasonable amount
-                    if 0.1 <= amount <= 100000:
-                        return amount
-                except ValueError:
-                    pass
-        
-        return None
+    def is_header_or_total(self, line: str) -> bool:
+        """Check if line is a header, total, or other non-item text"""
+        return self.keyword_matcher.matches(line, "header") or \
+               _SEPARATOR_LINE.match(line) or \
+               len(line) < 3
     
     def clean_item_name(self, name: str) -> str:
         """Clean and normalize item names"""
         # Remove common prefixes/suffixes and clean up
-        name = re.sub(r'^\d+\.?\s*', '', name)  # Remove leading numbers
-        name = re.sub(r'\s+[Xx]\s+\d+\.?\d*', '', name)  # Remove "x quantity"
-        name = re.sub(r'\s*\d+\.?\d*\s*$', '', name)  # Remove trailing numbers
-        name = re.sub(r'\s+', ' ', name)  # Normalize spaces
+        name = _LEADING_NUMBER.sub('', name)  # Remove leading numbers
+        name = _X_QUANTITY.sub('', name)  # Remove "x quantity"
+        name = self.strip_trailing_number(name)  # Remove trailing numbers
+        name = _WHITESPACE.sub(' ', name)  # Normalize spaces
         return name.strip()
     
+    def strip_trailing_number(self, name: str) -> str:
+        """Drop a trailing number and the whitespace around it, in linear time"""
+        stripped = name.rstrip()
+        start = trailing_number_start(stripped)
+        if start < 0:
+            return name
+        return stripped[:start].rstrip()
+    
     def looks_like_medicine(self, name: str) -> bool:
         """Check if the text looks like a medicine name"""
         if len(name) < 3:
             return False
         
-        # Common medicine patterns
-        medicine_indicators = [
-            'tab', 'cap', 'inj', 'syr', 'syp', 'cream', 'ointment', 'gel',
-            'mg', 'gm', 'ml', 'iv', 'oral', 'topical', 'injection'
-        ]
-        
         # Check for medicine-like words
-        lower_name = name.lower()
-        if any(indicator in lower_name for indicator in medicine_indicators):
+        if self.keyword_matcher.matches(name, "medicine"):
             return True
         
         # Check for proper capitalization (medicine names often have mixed case)
-        if re.match(r'^[A-Z][a-z]+(?:\s+[A-Z][a-z]*)*', name):
+        if _CAPITALISED.match(name):
             return True
         
         return len(name) >= 4 and not name.isdigit()
     
-    def is_valid_item(self, item: Dict) -> bool:
+    def is_valid_item(self, item: LineItem) -> bool:
         """Validate if extracted item makes sense"""
         # Check amount range
-        amount = item.get('item_amount', 0)
+        amount = item.item_amount
         if not (0.1 <= amount <= 100000):
             return False
         
         # Check item name
-        name = item.get('item_name', '')
+        name = item.item_name
         if len(name) < 2 or name.isdigit():
             return False
         
         # Skip obvious non-items
-        skip_words = ['total', 'subtotal', 'date', 'page', 'bill', 'no.']
-        if any(skip_word in name.lower() for skip_word in skip_words):
+        if self.keyword_matcher.matches(name, "non_item"):
             return False
         
         return True
     
+    def classify_header(self, text: str) -> str:
+        """Page type from a page's header band alone, for triage before full OCR.
+
+        "Other" only when the header names a non-bill document and shows no
+        bill marker or amounts; anything unsure stays billable.
+        """
+        classes = self.keyword_matcher.classes(text)
+        if "other_page" in classes and not classes & {"bill_page", "pharmacy_page", "final_bill_page"} \
+                and len(_AMOUNT.findall(text)) < 2:
+            return "Other"
+        return self.detect_page_type(text)
+    
     def detect_page_type(self, text: str) -> str:
         """Detect if page is Bill Detail, Final Bill, or Pharmacy"""
-        text_lower = text.lower()
+        classes = self.keyword_matcher.classes(text)
         
-        if any(word in text_lower for word in ['pharmacy', 'medicos', 'drug', 'cash memo', 'medicine']):
+        if "pharmacy_page" in classes:
             return "Pharmacy"
-        elif any(word in text_lower for word in ['final bill', 'grand total', 'net amount payable']):
+        elif "final_bill_page" in classes:
             return "Final Bill"
         else:
             return "Bill Detail"
\ No newline at end of file